@@ -19,12 +19,24 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+from artifacts import *
 from exceptions import *
+from jobserver import *
+from logs import *
 from maker import *
 from package import *
+from profiler import *
+from server import *
+from store import *
 
 __all__ = [
-    "EspactException", "TargetException", "NoRequiredTargetException", "UnmakingTargetException", "PackageException", "NoPackageException", "CommandFailureException", "CommandErrorException",
+    "ArtifactCache",
+    "EspactException", "TargetException", "NoRequiredTargetException", "UnmakingTargetException", "CycleException", "PackageException", "NoPackageException", "CommandFailureException", "CommandErrorException", "StoreException", "ServerException", "TemplateCompilationException",
+    "JobServer",
+    "CommandLog",
     "Maker",
-    "Target", "make_target", "Rule", "Package", "PackageCollection", 
+    "Target", "make_target", "Rule", "Package", "PackageCollection", "dump_yaml", "dump_json",
+    "Profiler", "NullProfiler",
+    "Server", "request_server", "server_socket_file",
+    "MadeTargetFileStore", "MadeTargetJournalStore", "SignatureStore", "made_target_store"
 ]
@@ -0,0 +1,168 @@
+# -*- coding: UTF-8 -*-
+# Copyright (c) 2018 Łukasz Szpakowski
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+from errno import EEXIST, ENOENT
+import hashlib
+from os.path import isabs, isdir, islink, join, lexists, normpath
+from os import getpid, listdir, lstat, makedirs, readlink, remove, rename, sep, stat, utime
+import stat as stat_module
+
+__all__ = ["ArtifactCache"]
+
+def _update_path_digest(hash, dir, path):
+    file = join(dir, path)
+    st = lstat(file)
+    if stat_module.S_ISLNK(st.st_mode):
+        hash.update("link\t" + path + "\t" + readlink(file) + "\n")
+    elif stat_module.S_ISDIR(st.st_mode):
+        hash.update("dir\t" + path + "\n")
+        for name in sorted(listdir(file)):
+            _update_path_digest(hash, dir, join(path, name))
+    else:
+        file_hash = hashlib.sha1()
+        stream = open(file, "rb")
+        try:
+            while True:
+                data = stream.read(65536)
+                if data == "":
+                    break
+                file_hash.update(data)
+        finally:
+            stream.close()
+        hash.update("file\t" + path + "\t" + str(st.st_mode & 0o111 != 0) + "\t" + file_hash.hexdigest() + "\n")
+
+def path_digest(dir, paths):
+    hash = hashlib.sha1()
+    try:
+        for path in paths:
+            _update_path_digest(hash, dir, normpath(path))
+    except (IOError, OSError):
+        return None
+    return hash.hexdigest()
+
+class ArtifactCache:
+    def __init__(self, dir, max_size = 1024 * 1024 * 1024):
+        self.dir = dir
+        self.max_size = max_size
+
+    def artifact_file(self, signature):
+        return join(self.dir, signature + ".tar.gz")
+
+    def has_artifact(self, signature):
+        return lexists(self.artifact_file(signature))
+
+    def restore(self, signature, work_dir, outputs):
+        import tarfile
+        artifact_file = self.artifact_file(signature)
+        try:
+            stream = tarfile.open(artifact_file, "r:gz")
+        except (IOError, OSError, tarfile.TarError):
+            return False
+        try:
+            try:
+                members = stream.getmembers()
+                for member in members:
+                    if not self._is_output_path(member.name, outputs):
+                        return False
+                for output in outputs:
+                    self._remove_path(join(work_dir, output))
+                stream.extractall(work_dir, members)
+            finally:
+                stream.close()
+            utime(artifact_file, None)
+        except (IOError, OSError, tarfile.TarError):
+            return False
+        return True
+
+    def store(self, signature, work_dir, outputs):
+        import tarfile
+        for output in outputs:
+            if not lexists(join(work_dir, output)):
+                return False
+        artifact_file = self.artifact_file(signature)
+        tmp_file = artifact_file + "." + str(getpid()) + ".tmp"
+        try:
+            try:
+                makedirs(self.dir)
+            except OSError as e:
+                if e.errno != EEXIST:
+                    raise
+            stream = tarfile.open(tmp_file, "w:gz")
+            try:
+                for output in outputs:
+                    stream.add(join(work_dir, output), output)
+            finally:
+                stream.close()
+            rename(tmp_file, artifact_file)
+        except (IOError, OSError, tarfile.TarError):
+            try:
+                remove(tmp_file)
+            except OSError:
+                pass
+            return False
+        self.evict()
+        return True
+
+    def evict(self):
+        try:
+            files = []
+            size = 0
+            for name in listdir(self.dir):
+                if name.endswith(".tar.gz"):
+                    file = join(self.dir, name)
+                    try:
+                        st = stat(file)
+                    except OSError as e:
+                        if e.errno == ENOENT:
+                            continue
+                        raise
+                    files.append((st.st_mtime, file, st.st_size))
+                    size += st.st_size
+            files.sort()
+            for mtime, file, file_size in files:
+                if size <= self.max_size:
+                    break
+                try:
+                    remove(file)
+                except OSError as e:
+                    if e.errno != ENOENT:
+                        raise
+                size -= file_size
+        except (IOError, OSError):
+            pass
+
+    def _is_output_path(self, path, outputs):
+        path = normpath(path)
+        if isabs(path) or path == ".." or path.startswith(".." + sep):
+            return False
+        for output in outputs:
+            output = normpath(output)
+            if path == output or path.startswith(output + sep):
+                return True
+        return False
+
+    def _remove_path(self, path):
+        import shutil
+        if isdir(path) and not islink(path):
+            shutil.rmtree(path)
+        elif lexists(path):
+            remove(path)
@@ -0,0 +1,799 @@
+# -*- coding: UTF-8 -*-
+# Copyright (c) 2018 Łukasz Szpakowski
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import math
+import os
+from os.path import join, realpath
+import sys
+from sys import exit
+import threading
+from getopt import GetoptError, getopt
+import espact
+
+def load_compiler_cache_stats(prog, environ = None):
+    import subprocess
+    try:
+        devnull = open(os.devnull, "w")
+        try:
+            popen = subprocess.Popen([prog, "--print-stats"], stdout = subprocess.PIPE, stderr = devnull, env = environ)
+            output_string = popen.communicate()[0]
+        finally:
+            devnull.close()
+    except (IOError, OSError):
+        return None
+    if popen.returncode != 0:
+        return None
+    stats = {}
+    for line in output_string.splitlines():
+        fields = line.split("\t")
+        if len(fields) == 2 and not fields[0].endswith("_timestamp"):
+            try:
+                stats[fields[0]] = int(fields[1])
+            except ValueError:
+                pass
+    return stats
+
+def machine_cpu_count():
+    import multiprocessing
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return None
+
+def machine_mem_size():
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def main(argv = None, stdout = None, stderr = None, package_collections = None, command_output_fun = None, cwd = None, environ = None):
+    if argv == None:
+        argv = sys.argv
+    if stdout == None:
+        stdout = sys.stdout
+    if stderr == None:
+        stderr = sys.stderr
+    exit_funs = []
+    try:
+        try:
+            try:
+                opts, args = getopt(argv[1:], "ilM:m:rTtu:D:d:fj:knw", [
+                        "compile-templates",
+                        "critical-path=",
+                        "impact=",
+                        "info",
+                        "list",
+                        "targets-to-make=",
+                        "make=",
+                        "rdeps=",
+                        "rules",
+                        "suggest-weights",
+                        "made-targets",
+                        "targets",
+                        "unmake=",
+                        "unmaking-targets",
+                        "artifact-cache=",
+                        "artifact-cache-size=",
+                        "bytecode-cache",
+                        "check-graph",
+                        "client",
+                        "compiler-cache-stats=",
+                        "compress-logs",
+                        "cpu-budget=",
+                        "directory=",
+                        "fake",
+                        "format=",
+                        "help",
+                        "jobs=",
+                        "jobserver",
+                        "keep-going",
+                        "log-size=",
+                        "log-tail=",
+                        "logs",
+                        "measure-memory",
+                        "mem-budget=",
+                        "no-make-targets",
+                        "package-cache",
+                        "profile=",
+                        "server",
+                        "signatures",
+                        "store=",
+                        "track-templates",
+                        "work-directory="
+                ])
+            except GetoptError as e:
+                stderr.write("error: " + str(e) + "\n")
+                exit(1)
+
+            package_collection_dir = "."
+            work_dir = None
+            command = "make"
+            target_names = ["build"]
+            query_targets = []
+            query_package_paths = []
+            vars = {}
+            is_fake = False
+            output_format = "yaml"
+            jobs = 1
+            is_job_server = False
+            can_add_made_target = True
+            can_use_package_cache = False
+            can_use_bytecode_cache = False
+            store_name = None
+            profile_file = None
+            can_use_signatures = False
+            artifact_cache_dir = None
+            artifact_cache_size = 1024
+            compiler_cache_prog = None
+            can_check_graph = False
+            can_keep_going = False
+            can_log_commands = False
+            can_compress_logs = False
+            max_log_size = None
+            log_tail_size = 16
+            cpu_budget = None
+            mem_budget = None
+            can_track_templates = False
+            can_measure_memory = False
+            is_server = False
+            is_client = False
+
+            for opt, opt_arg in opts:
+                if opt == "--compile-templates":
+                    command = "compile_templates"
+                    can_use_bytecode_cache = True
+                elif opt == "--critical-path":
+                    command = "critical_path"
+                    target_names = opt_arg.split(",")
+                elif opt == "--impact":
+                    command = "impact"
+                    query_package_paths = opt_arg.split(",")
+                elif opt == "-i" or opt == "--info":
+                    command = "info"
+                elif opt == "-l" or opt == "--list":
+                    command = "list"
+                elif opt == "-M" or opt == "--targets-to-make":
+                    command = "targets_to_make"
+                    target_names = opt_arg.split(",")
+                elif opt == "-m" or opt == "--make":
+                    command = "make"
+                    target_names = opt_arg.split(",")
+                elif opt == "--rdeps":
+                    command = "rdeps"
+                    query_targets = []
+                    for string in opt_arg.split(","):
+                        strings = string.rsplit(":", 1)
+                        if len(strings) == 2:
+                            query_targets.append(espact.make_target(strings[0], strings[1]))
+                        else:
+                            query_targets.append(espact.make_target(strings[0], "build"))
+                elif opt == "-r" or opt == "--rules":
+                    command = "rules"
+                elif opt == "--suggest-weights":
+                    command = "suggest_weights"
+                elif opt == "-T" or opt == "--made-targets":
+                    command = "made_targets"
+                elif opt == "-t" or opt == "--targets":
+                    command = "targets"
+                elif opt == "-u" or opt == "--unmake":
+                    command = "unmake"
+                    target_names = opt_arg.split(",")
+                elif opt == "--unmaking-targets":
+                    command = "unmaking_targets"
+                elif opt == "--bytecode-cache":
+                    can_use_bytecode_cache = True
+                elif opt == "--artifact-cache":
+                    artifact_cache_dir = opt_arg
+                    can_use_signatures = True
+                elif opt == "--artifact-cache-size":
+                    try:
+                        artifact_cache_size = int(opt_arg)
+                    except ValueError:
+                        artifact_cache_size = -1
+                    if artifact_cache_size < 0:
+                        stderr.write("error: incorrect size of artifact cache\n")
+                        exit(1)
+                elif opt == "--check-graph":
+                    can_check_graph = True
+                elif opt == "--client":
+                    is_client = True
+                elif opt == "--compiler-cache-stats":
+                    compiler_cache_prog = opt_arg
+                elif opt == "--compress-logs":
+                    can_log_commands = True
+                    can_compress_logs = True
+                elif opt == "--cpu-budget":
+                    try:
+                        cpu_budget = float(opt_arg)
+                    except ValueError:
+                        cpu_budget = -1.0
+                    if cpu_budget <= 0.0:
+                        stderr.write("error: incorrect CPU budget\n")
+                        exit(1)
+                elif opt == "-D":
+                    strings = opt_arg.split("=", 1)
+                    if len(strings) == 2:
+                        name, value = strings
+                        vars[name] = value
+                    else:
+                        stderr.write("error: incorrect argument\n")
+                        exit(1)
+                elif opt == "-d" or opt == "--directory":
+                    package_collection_dir = opt_arg
+                elif opt == "-f" or opt == "--fake":
+                    is_fake = True
+                elif opt == "--format":
+                    if opt_arg not in ["yaml", "json"]:
+                        stderr.write("error: unknown format " + opt_arg + "\n")
+                        exit(1)
+                    output_format = opt_arg
+                elif opt == "--help":
+                    stdout.write("Usage: " + argv[0] + " [<command>] [<option> ...] [<package> ...]\n")
+                    stdout.write("\n")
+                    stdout.write("Commands:\n")
+                    stdout.write("      --compile-templates       compile all templates to bytecode cache\n")
+                    stdout.write("      --critical-path=[<target>,...] display chain of targets which takes\n")
+                    stdout.write("                                longest time to make according to history\n")
+                    stdout.write("      --impact=<package>,...    display packages which have targets which\n")
+                    stdout.write("                                depend on targets of packages (with these\n")
+                    stdout.write("                                packages)\n")
+                    stdout.write("  -i, --info                    display information about packages\n")
+                    stdout.write("  -l, --list                    display list of packages\n")
+                    stdout.write("  -M, --targets-to-make=[<target>,...] display targets which would be made by\n")
+                    stdout.write("                                --make command with same targets\n")
+                    stdout.write("  -m, --make=[<target>,...]     make targets for packages (this command with\n")
+                    stdout.write("                                build target is default)\n")
+                    stdout.write("      --rdeps=<package>[:<target>],... display targets which depend on\n")
+                    stdout.write("                                targets (default target is build)\n")
+                    stdout.write("  -r, --rules                   display rules of packages\n")
+                    stdout.write("      --suggest-weights         display weights of rules (cpu and mem) which\n")
+                    stdout.write("                                are suggested according to history (mem is\n")
+                    stdout.write("                                only measured with --measure-memory)\n")
+                    stdout.write("  -T, --made-targets            display made targets of packages\n")
+                    stdout.write("  -t, --targets                 display all targets of packages\n")
+                    stdout.write("  -u, --unmake=[<target>,...]   set targets as unmade for packages\n")
+                    stdout.write("      --unmaking-targets        display targets which aren't unmade but are to\n")
+                    stdout.write("                                unmake after making of other targets\n")
+                    stdout.write("\n")
+                    stdout.write("Options:\n")
+                    stdout.write("      --artifact-cache=<directory> restore outputs of targets from directory\n")
+                    stdout.write("                                and store them in directory (this option\n")
+                    stdout.write("                                implies --signatures)\n")
+                    stdout.write("      --artifact-cache-size=<size> set maximal size of artifact cache in\n")
+                    stdout.write("                                megabytes (default is 1024)\n")
+                    stdout.write("      --bytecode-cache          cache compiled templates in work directory\n")
+                    stdout.write("      --check-graph             check whole graph of targets for cycles before\n")
+                    stdout.write("                                making of targets\n")
+                    stdout.write("      --client                  send command to server of work directory\n")
+                    stdout.write("      --compiler-cache-stats=<program> display changes of statistics of compiler\n")
+                    stdout.write("                                cache program (for example ccache) after making\n")
+                    stdout.write("      --compress-logs           compress logs of commands by gzip (this option\n")
+                    stdout.write("                                implies --logs)\n")
+                    stdout.write("      --cpu-budget=<number>     set number of processors for rules which have cpu\n")
+                    stdout.write("                                weight (default is number of processors)\n")
+                    stdout.write("  -D <variable>=<value>         define variable\n")
+                    stdout.write("  -d, --directory=<directory>   set directory of package collection\n")
+                    stdout.write("  -f, --fake                    don't execute shell commands for targets\n")
+                    stdout.write("      --format=<format>         set output format (yaml or json)\n")
+                    stdout.write("      --help                    display this text\n")
+                    stdout.write("  -j, --jobs=<number>           make at most number of targets at once or load\n")
+                    stdout.write("                                packages in number of processes for commands\n")
+                    stdout.write("                                which display packages\n")
+                    stdout.write("      --jobserver               share number of jobs with GNU make programs\n")
+                    stdout.write("                                which are invoked by shell commands\n")
+                    stdout.write("  -k, --keep-going              make targets which don't depend on failed\n")
+                    stdout.write("                                targets after failure of command\n")
+                    stdout.write("      --log-size=<size>         set maximal size of log of command in kilobytes\n")
+                    stdout.write("                                (this option implies --logs)\n")
+                    stdout.write("      --log-tail=<size>         set size of end of log which is displayed after\n")
+                    stdout.write("                                failure of command in kilobytes (default is 16)\n")
+                    stdout.write("      --logs                    write output of commands to logs in work\n")
+                    stdout.write("                                directory instead of standard output\n")
+                    stdout.write("      --measure-memory          measure peak memory of commands for\n")
+                    stdout.write("                                --suggest-weights command\n")
+                    stdout.write("      --mem-budget=<size>       set memory in megabytes for rules which have mem\n")
+                    stdout.write("                                weight (default is size of physical memory)\n")
+                    stdout.write("  -n, --no-make-targets         don't set targets as made after making of\n")
+                    stdout.write("                                these targets\n")
+                    stdout.write("      --package-cache           cache rendered packages in work directory\n")
+                    stdout.write("      --profile=<file>          write Chrome trace of phases to file and display\n")
+                    stdout.write("                                summary of phases\n")
+                    stdout.write("      --server                  serve commands of clients and keep packages\n")
+                    stdout.write("                                and made targets in memory\n")
+                    stdout.write("      --signatures              make targets only if signatures of rules and\n")
+                    stdout.write("                                required targets are changed\n")
+                    stdout.write("      --store=<store>           set store of made targets (files or journal;\n")
+                    stdout.write("                                journal store migrates made targets from files)\n")
+                    stdout.write("      --track-templates         make targets again if files of package or its\n")
+                    stdout.write("                                templates are changed\n")
+                    stdout.write("  -w, --work-directory=<directory> set work directory (default work directory\n")
+                    stdout.write("                                is in directory of package collection and has\n")
+                    stdout.write("                                work name)\n")
+                    exit(0)
+                elif opt == "-j" or opt == "--jobs":
+                    try:
+                        jobs = int(opt_arg)
+                    except ValueError:
+                        jobs = 0
+                    if jobs < 1:
+                        stderr.write("error: incorrect number of jobs\n")
+                        exit(1)
+                elif opt == "--jobserver":
+                    is_job_server = True
+                elif opt == "-k" or opt == "--keep-going":
+                    can_keep_going = True
+                elif opt == "--log-size":
+                    try:
+                        max_log_size = int(opt_arg)
+                    except ValueError:
+                        max_log_size = -1
+                    if max_log_size <= 0:
+                        stderr.write("error: incorrect size of log\n")
+                        exit(1)
+                    can_log_commands = True
+                elif opt == "--log-tail":
+                    try:
+                        log_tail_size = int(opt_arg)
+                    except ValueError:
+                        log_tail_size = -1
+                    if log_tail_size < 0:
+                        stderr.write("error: incorrect size of log tail\n")
+                        exit(1)
+                elif opt == "--logs":
+                    can_log_commands = True
+                elif opt == "--measure-memory":
+                    can_measure_memory = True
+                elif opt == "--mem-budget":
+                    try:
+                        mem_budget = float(opt_arg)
+                    except ValueError:
+                        mem_budget = -1.0
+                    if mem_budget <= 0.0:
+                        stderr.write("error: incorrect memory budget\n")
+                        exit(1)
+                elif opt == "-n" or opt == "--no-make-targets":
+                    can_add_made_target = False
+                elif opt == "--package-cache":
+                    can_use_package_cache = True
+                elif opt == "--profile":
+                    profile_file = opt_arg
+                elif opt == "--server":
+                    is_server = True
+                elif opt == "--signatures":
+                    can_use_signatures = True
+                elif opt == "--store":
+                    if opt_arg not in ["files", "journal"]:
+                        stderr.write("error: unknown store " + opt_arg + "\n")
+                        exit(1)
+                    store_name = opt_arg
+                elif opt == "--track-templates":
+                    can_track_templates = True
+                elif opt == "-w" or opt == "--work-directory":
+                    work_dir = opt_arg
+
+            if work_dir == None:
+                work_dir = join(package_collection_dir, "work")
+
+            if cwd != None:
+                package_collection_dir = join(cwd, package_collection_dir)
+                work_dir = join(cwd, work_dir)
+                if artifact_cache_dir != None:
+                    artifact_cache_dir = join(cwd, artifact_cache_dir)
+                if profile_file != None:
+                    profile_file = join(cwd, profile_file)
+                if compiler_cache_prog != None and "/" in compiler_cache_prog:
+                    compiler_cache_prog = join(cwd, compiler_cache_prog)
+
+            if is_server or is_client:
+                if package_collections != None:
+                    stderr.write("error: server can't serve --server and --client options\n")
+                    exit(1)
+                if is_server and is_client:
+                    stderr.write("error: --server and --client options are exclusive\n")
+                    exit(1)
+                socket_file = espact.server_socket_file(realpath(work_dir))
+                if is_client:
+                    try:
+                        return espact.request_server(socket_file, filter(lambda arg: arg != "--client", argv), os.getcwd(), os.environ, stdout, stderr)
+                    except espact.EspactException as e:
+                        stderr.write("error: " + str(e) + "\n")
+                        exit(1)
+                else:
+                    server_package_collections = {}
+
+                    def serve_request(request_argv, request_cwd, request_environ, request_stdout, request_stderr):
+                        return main(request_argv, request_stdout, request_stderr, server_package_collections, request_stdout.write, request_cwd, request_environ)
+
+                    def terminate_server(signum, frame):
+                        raise KeyboardInterrupt()
+
+                    import signal
+                    signal.signal(signal.SIGTERM, terminate_server)
+                    server = espact.Server(socket_file, serve_request)
+                    try:
+                        server.listen()
+                        server.serve()
+                    except espact.EspactException as e:
+                        stderr.write("error: " + str(e) + "\n")
+                        exit(1)
+                    except KeyboardInterrupt:
+                        pass
+                    finally:
+                        server.close()
+                    exit(0)
+
+            if profile_file != None:
+                profiler = espact.Profiler()
+
+                def write_profile():
+                    try:
+                        profiler.write_trace(profile_file)
+                    except IOError as e:
+                        stderr.write("error: " + str(e) + "\n")
+                    for line in profiler.summary():
+                        stderr.write("*** Profile: " + line + "\n")
+
+                exit_funs.append(write_profile)
+            else:
+                profiler = None
+
+            if package_collections != None and profiler == None:
+                is_read_only = command not in ["compile_templates", "make", "unmake"]
+                package_collection_key = (realpath(package_collection_dir), realpath(work_dir), tuple(sorted(vars.items())), can_use_package_cache, can_use_bytecode_cache, store_name, is_read_only)
+                package_collection_entry = package_collections.setdefault(package_collection_key, [None, threading.Lock()])
+                package_collection_entry[1].acquire()
+                exit_funs.append(package_collection_entry[1].release)
+                package_collection = package_collection_entry[0]
+                if package_collection != None:
+                    package_collection.refresh()
+                else:
+                    package_collection = espact.PackageCollection(dir = package_collection_dir, work_dir = work_dir, vars = vars, can_use_package_cache = can_use_package_cache, can_use_bytecode_cache = can_use_bytecode_cache, store_name = store_name)
+                    package_collection.can_watch_files = True
+                    package_collection_entry[0] = package_collection
+            else:
+                package_collection = espact.PackageCollection(dir = package_collection_dir, work_dir = work_dir, vars = vars, can_use_package_cache = can_use_package_cache, can_use_bytecode_cache = can_use_bytecode_cache, store_name = store_name, profiler = profiler)
+            package_collection.command_output_fun = command_output_fun
+            package_collection.environ = environ
+            package_collection.can_log_commands = can_log_commands
+            package_collection.can_compress_logs = can_compress_logs
+            if max_log_size != None:
+                package_collection.max_log_size = max_log_size * 1024
+            else:
+                package_collection.max_log_size = None
+            package_collection.log_tail_size = log_tail_size * 1024
+            package_collection.can_measure_memory = can_measure_memory
+            if args != []:
+                package_paths = args
+            else:
+                package_paths = sorted(package_collection.get_package_paths())
+
+            if command in ["critical_path", "info", "rules", "suggest_weights"]:
+                json_data = {}
+            else:
+                json_data = []
+
+            def output(data):
+                if output_format == "json":
+                    if isinstance(data, dict):
+                        json_data.update(data)
+                    else:
+                        json_data.extend(data)
+                else:
+                    stdout.write(espact.dump_yaml(data))
+
+            def pre_make_for_make(target, is_made_target):
+                if not is_made_target:
+                    stdout.write("*** Making target " + str(target) + " ...\n")
+                else:
+                    stdout.write("*** Already made target " + str(target) + "\n")
+                stdout.flush()
+
+            def post_make_for_make(target, is_previously_made_target):
+                if not is_previously_made_target:
+                    stdout.write("*** Made target " + str(target) + "\n")
+                    stdout.flush()
+
+            def cycle_for_make(target1, target2):
+                raise espact.CycleException(target1, target2)
+
+            def check_graph(maker, targets):
+                try:
+                    cycles = maker.get_cycles(targets)
+                except espact.EspactException as e:
+                    stderr.write("error: " + str(e) + "\n")
+                    exit(1)
+                for cycle in cycles:
+                    stderr.write("error: cycle was detected between targets " + ", ".join(map(str, cycle)) + "\n")
+                if cycles != []:
+                    exit(1)
+
+            def pre_make_for_targets_to_make(target, is_made_target):
+                pass
+
+            def post_make_for_targets_to_make(target, is_prev_made_target):
+                if not is_prev_made_target:
+                    output([target])
+
+            def cycle_for_targets_to_make(target1, target2):
+                stderr.write("error: " + str(espact.CycleException(target1, target2)) + "\n")
+                exit(1)
+
+            status = 0
+            if jobs > 1 and command in ["impact", "info", "made_targets", "rdeps", "rules", "targets", "targets_to_make"]:
+                package_paths = package_collection.load_packages_in_pool(package_paths, jobs)
+                if command in ["impact", "rdeps", "targets_to_make"]:
+                    package_paths = list(package_paths)
+
+            if command == "compile_templates":
+                for e in package_collection.compile_templates():
+                    stderr.write("error: " + str(e) + "\n")
+                    status = 1
+            elif command == "info":
+                for package_path in package_paths:
+                    try:
+                        package = package_collection.get_package(package_path)
+                        output({ package_path: package.info })
+                    except espact.EspactException as e:
+                        stderr.write("error: " + str(e) + "\n")
+                        status = 1
+            elif command == "list":
+                for package_path in package_paths:
+                    if package_collection.has_package(package_path):
+                        output([package_path])
+                    else:
+                        stderr.write("error: " + str(espact.NoPackageException(package_path)) + "\n")
+                        status = 1
+            elif command == "targets_to_make":
+                maker = espact.Maker(package_collection, pre_make_for_targets_to_make, post_make_for_targets_to_make, cycle_for_targets_to_make, is_fake = True, can_add_made_target = can_add_made_target, can_create_made_target_file = False, can_use_signatures = can_use_signatures, can_track_templates = can_track_templates)
+                if can_check_graph:
+                    targets = []
+                    for package_path in package_paths:
+                        for target_name in target_names:
+                            try:
+                                if target_name in package_collection.get_package(package_path).rules:
+                                    targets.append(espact.make_target(package_path, target_name))
+                            except espact.EspactException as e:
+                                stderr.write("error: " + str(e) + "\n")
+                                exit(1)
+                    check_graph(maker, targets)
+                for package_path in package_paths:
+                    for target_name in target_names:
+                        try:
+                            if target_name in package_collection.get_package(package_path).rules:
+                                target = espact.make_target(package_path, target_name)
+                                maker.make(target)
+                        except espact.EspactException as e:
+                            stderr.write("error: " + str(e) + "\n")
+                            exit(1)
+            elif command in ["impact", "rdeps"]:
+                maker = espact.Maker(package_collection, cycle_fun = lambda target1, target2: None)
+                try:
+                    all_targets = []
+                    for package_path in package_paths:
+                        for target_name in package_collection.get_package(package_path).rules.keys():
+                            all_targets.append(espact.make_target(package_path, target_name))
+                    if command == "impact":
+                        targets = []
+                        for package_path in query_package_paths:
+                            for target_name in package_collection.get_package(package_path).rules.keys():
+                                targets.append(espact.make_target(package_path, target_name))
+                    else:
+                        targets = query_targets
+                        for target in targets:
+                            if target.name not in package_collection.get_package(target.package_path).rules:
+                                raise espact.TargetException(target, "no target " + str(target))
+                    dependent_targets = maker.get_dependent_targets(targets, all_targets)
+                except espact.EspactException as e:
+                    stderr.write("error: " + str(e) + "\n")
+                    exit(1)
+                if command == "impact":
+                    impact_package_paths = sorted(set(query_package_paths + map(lambda target: target.package_path, dependent_targets)))
+                    if impact_package_paths != []:
+                        output(impact_package_paths)
+                elif dependent_targets != []:
+                    output(dependent_targets)
+            elif command == "critical_path":
+                maker = espact.Maker(package_collection, cycle_fun = cycle_for_targets_to_make)
+                targets = []
+                for package_path in package_paths:
+                    for target_name in target_names:
+                        try:
+                            if target_name in package_collection.get_package(package_path).rules:
+                                targets.append(espact.make_target(package_path, target_name))
+                        except espact.EspactException as e:
+                            stderr.write("error: " + str(e) + "\n")
+                            exit(1)
+                try:
+                    critical_path = maker.get_critical_path(targets)
+                except espact.EspactException as e:
+                    stderr.write("error: " + str(e) + "\n")
+                    exit(1)
+                wall_time = sum(map(lambda pair: pair[1], critical_path))
+                output({
+                    "critical_path": map(lambda pair: { "target": pair[0], "wall_time": pair[1] }, critical_path),
+                    "wall_time": wall_time
+                })
+            elif command == "make":
+                if compiler_cache_prog != None:
+                    compiler_cache_stats = load_compiler_cache_stats(compiler_cache_prog, environ)
+                    if compiler_cache_stats == None:
+                        stderr.write("error: can't load statistics of " + compiler_cache_prog + "\n")
+                        exit(1)
+
+                    def write_compiler_cache_stats():
+                        new_compiler_cache_stats = load_compiler_cache_stats(compiler_cache_prog, environ)
+                        if new_compiler_cache_stats == None:
+                            stderr.write("error: can't load statistics of " + compiler_cache_prog + "\n")
+                            return
+                        for name in sorted(new_compiler_cache_stats.keys()):
+                            delta = new_compiler_cache_stats[name] - compiler_cache_stats.get(name, 0)
+                            if delta != 0:
+                                stderr.write("*** Compiler cache: " + name + ": " + ("%+d" % delta) + "\n")
+
+                    exit_funs.append(write_compiler_cache_stats)
+                if is_job_server:
+                    job_server = espact.JobServer(jobs, environ)
+                    exit_funs.append(job_server.close)
+                else:
+                    job_server = None
+                if artifact_cache_dir != None:
+                    artifact_cache = espact.ArtifactCache(artifact_cache_dir, artifact_cache_size * 1024 * 1024)
+                else:
+                    artifact_cache = None
+                if cpu_budget == None:
+                    cpu_budget = machine_cpu_count()
+                if mem_budget == None:
+                    mem_budget = machine_mem_size()
+                maker = espact.Maker(package_collection, pre_make_for_make, post_make_for_make, cycle_for_make, is_fake = is_fake, can_add_made_target = can_add_made_target, jobs = jobs, job_server = job_server, can_use_signatures = can_use_signatures, artifact_cache = artifact_cache, can_keep_going = can_keep_going, cpu_budget = cpu_budget, mem_budget = mem_budget, can_track_templates = can_track_templates)
+                package_exceptions = []
+
+                def generate_targets_to_make():
+                    for package_path in package_paths:
+                        try:
+                            package = package_collection.get_package(package_path)
+                        except espact.EspactException as e:
+                            if not can_keep_going:
+                                raise
+                            package_exceptions.append(e)
+                            continue
+                        for target_name in target_names:
+                            if target_name in package.rules:
+                                yield espact.make_target(package_path, target_name)
+
+                package_collection.prefetch_packages(package_paths)
+                exit_funs.append(package_collection.stop_prefetching_packages)
+                if can_check_graph:
+                    try:
+                        targets = list(generate_targets_to_make())
+                    except espact.EspactException as e:
+                        stderr.write("error: " + str(e) + "\n")
+                        exit(1)
+                    check_graph(maker, targets)
+                else:
+                    targets = generate_targets_to_make()
+                try:
+                    maker.make_targets(targets)
+                except espact.EspactException as e:
+                    stderr.write("error: " + str(e) + "\n")
+                    exit(1)
+                if package_exceptions != [] or maker.failed_targets != []:
+                    for e in package_exceptions:
+                        stderr.write("error: " + str(e) + "\n")
+                    for target, e in maker.failed_targets:
+                        stderr.write("error: " + str(e) + "\n")
+                    for target, e in maker.failed_targets:
+                        stderr.write("*** Failed target " + str(target) + "\n")
+                    for target in maker.blocked_targets:
+                        stderr.write("*** Blocked target " + str(target) + "\n")
+                    stderr.write("*** " + str(len(package_exceptions)) + " packages with errors, " + str(len(maker.failed_targets)) + " failed targets, " + str(len(maker.blocked_targets)) + " blocked targets\n")
+                    exit(1)
+            elif command == "rules":
+                for package_path in package_paths:
+                    try:
+                        package = package_collection.get_package(package_path)
+                        output({ package_path: package.rules })
+                    except espact.EspactException as e:
+                        stderr.write("error: " + str(e) + "\n")
+                        status = 1
+            elif command == "suggest_weights":
+                for package_path in package_paths:
+                    try:
+                        package = package_collection.get_package(package_path)
+                        weights = {}
+                        for target_name in package.rules.keys():
+                            record = package_collection.get_command_record(espact.make_target(package_path, target_name))
+                            if record != None and record.status == 0:
+                                weight = {}
+                                if record.wall_time > 0.0:
+                                    weight["cpu"] = max(1, int(math.ceil(record.cpu_time / record.wall_time)))
+                                if record.max_rss != None:
+                                    weight["mem"] = int(math.ceil(record.max_rss / 1024.0))
+                                if weight != {}:
+                                    weights[target_name] = weight
+                        if weights != {}:
+                            output({ package_path: weights })
+                    except espact.EspactException as e:
+                        stderr.write("error: " + str(e) + "\n")
+                        status = 1
+            elif command == "made_targets":
+                for package_path in package_paths:
+                    try:
+                        package = package_collection.get_package(package_path)
+                        made_targets = []
+                        for target_name in sorted(package.rules.keys()):
+                            target = espact.make_target(package_path, target_name)
+                            if package_collection.has_made_target(target):
+                                made_targets.append(target)
+                        if len(made_targets) > 0:
+                            output(made_targets)
+                    except espact.EspactException as e:
+                        stderr.write("error: " + str(e) + "\n")
+                        status = 1
+            elif command == "targets":
+                for package_path in package_paths:
+                    try:
+                        package = package_collection.get_package(package_path)
+                        targets = sorted(map(lambda target_name: espact.make_target(package_path, target_name), package.rules.keys()))
+                        if len(targets) > 0:
+                            output(targets)
+                    except espact.EspactException as e:
+                        stderr.write("error: " + str(e) + "\n")
+                        status = 1
+            elif command == "unmake":
+                for package_path in package_paths:
+                    for target_name in target_names:
+                        try:
+                            if target_name in package_collection.get_package(package_path).rules:
+                                target = espact.make_target(package_path, target_name)
+                                package_collection.remove_made_target(target)
+                                package_collection.add_forced_target(target)
+                        except espact.EspactException as e:
+                            stderr.write("error: " + str(e) + "\n")
+                            status = 1
+                try:
+                    package_collection.flush_made_targets()
+                except espact.EspactException as e:
+                    stderr.write("error: " + str(e) + "\n")
+                    status = 1
+            elif command == "unmaking_targets":
+                for package_path in package_paths:
+                    try:
+                        package = package_collection.get_package(package_path)
+                        unmaking_targets = []
+                        for target_name in sorted(package.rules.keys()):
+                            target = espact.make_target(package_path, target_name)
+                            if package_collection.has_unmaking_target(target):
+                                unmaking_targets.append(target)
+                        if len(unmaking_targets) > 0:
+                            output(unmaking_targets)
+                    except espact.EspactException as e:
+                        stderr.write("error: " + str(e) + "\n")
+                        status = 1
+
+            if output_format == "json" and command not in ["compile_templates", "make", "unmake"]:
+                stdout.write(espact.dump_json(json_data) + "\n")
+            return status
+        except SystemExit as e:
+            return e.code
+    finally:
+        for fun in reversed(exit_funs):
+            fun()
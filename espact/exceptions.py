@@ -19,8 +19,7 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-import jinja2
-import yaml
+__all__ = ["EspactException", "TargetException", "NoRequiredTargetException", "UnmakingTargetException", "CycleException", "PackageException", "NoPackageException", "CommandFailureException", "CommandErrorException", "StoreException", "ServerException", "TemplateCompilationException"]
 
 class EspactException(Exception):
     pass
@@ -47,6 +46,14 @@ class UnmakingTargetException(EspactException):
     def __str__(self):
         return "target " + str(self.target) + " isn't unmade"
 
+class CycleException(EspactException):
+    def __init__(self, target1, target2):
+        self.target1 = target1
+        self.target2 = target2
+
+    def __str__(self):
+        return "cycle was detected between target " + str(self.target1) + " and target " + str(self.target2)
+
 class PackageException(EspactException):
     def __init__(self, path, message):
         self.path = path
@@ -81,6 +88,30 @@ class CommandErrorException(EspactException):
     def __str__(self):
         return "error of command of rule " + str(self.target) + ": " + self.message
 
+class StoreException(EspactException):
+    def __init__(self, file, message):
+        self.file = file
+        self.message = message
+
+    def __str__(self):
+        return "store " + self.file + ": " + self.message
+
+class ServerException(EspactException):
+    def __init__(self, file, message):
+        self.file = file
+        self.message = message
+
+    def __str__(self):
+        return "server " + self.file + ": " + self.message
+
+class TemplateCompilationException(EspactException):
+    def __init__(self, name, message):
+        self.name = name
+        self.message = message
+
+    def __str__(self):
+        return "template " + self.name + ": " + self.message
+
 class TemplateException(EspactException):
     def __init__(self, file, traceback_lines):
         self.file = file
@@ -90,6 +121,8 @@ class TemplateException(EspactException):
         return "exception from template " + self.file + ":\n" + ("".join(map(lambda line: "  " + line, self.traceback_lines)))
 
 def exception_to_package_exception(exception, path):
+    import jinja2
+    import yaml
     if isinstance(exception, jinja2.TemplateNotFound):
         return PackageException(path, "no template " + exception.name)
     elif isinstance(exception, jinja2.TemplateSyntaxError):
@@ -123,3 +156,6 @@ def exception_to_package_exception(exception, path):
         return PackageException(path, str(exception))
     else:
         return PackageException(path, "unknown error")
+
+def exception_to_template_compilation_exception(exception, name):
+    return TemplateCompilationException(name, exception_to_package_exception(exception, name).message)
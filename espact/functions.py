@@ -19,17 +19,21 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import hashlib
+import json
 import os
 from os import sep
-from os.path import isfile, join
+from os.path import dirname, join
 import platform
 import re
 import threading
-import jinja2
 from espact.filters import default_filters, shsqe
+from espact.index import package_index
 from espact.variables import default_variables
 
 _env = threading.local()
+_directory_reads = threading.local()
+_bytecode_cache = None
 
 default_functions = {}
 
@@ -44,14 +48,45 @@ def _indent(string, width, indentfirst):
     new_lines += map(lambda line: (" " * width) + line, lines)
     return "\n".join(new_lines)
 
-def _render_template(file, *args, **kwargs):
+def _add_directory_read():
+    _directory_reads.count = _directory_read_count() + 1
+
+def _directory_read_count():
+    return getattr(_directory_reads, "count", 0)
+
+def _get_env():
     global _env
     if not hasattr(_env, "env"):
-        _env.env = jinja2.Environment(loader = jinja2.PackageLoader("espact", "templates"))
+        import jinja2
+        _env.env = jinja2.Environment(loader = jinja2.PackageLoader("espact", "templates"), bytecode_cache = _bytecode_cache)
         _env.env.globals.update(default_variables)
         _env.env.globals.update(default_functions)
         _env.env.filters.update(default_filters)
-    template = _env.env.get_template(file)
+    return _env.env
+
+def set_bytecode_cache(bytecode_cache):
+    global _bytecode_cache
+    _bytecode_cache = bytecode_cache
+    if hasattr(_env, "env"):
+        _env.env.bytecode_cache = bytecode_cache
+
+def compile_templates():
+    import jinja2
+    env = _get_env()
+    errors = []
+    for name in env.list_templates():
+        try:
+            env.get_template(name)
+        except (jinja2.TemplateError, IOError) as e:
+            errors.append((name, e))
+    return errors
+
+def template_files():
+    dir = join(dirname(__file__), "templates")
+    return map(lambda name: join(dir, name), sorted(os.listdir(dir)))
+
+def _render_template(file, *args, **kwargs):
+    template = _get_env().get_template(file)
     new_kwargs = {}
     new_kwargs.update(kwargs)
     new_kwargs["indent"] = 0
@@ -60,6 +95,12 @@ def _render_template(file, *args, **kwargs):
     new_kwargs2["fun_args"] = new_kwargs
     return _indent(template.render(*args, **new_kwargs2), kwargs.get("indent", 4), kwargs.get("indentfirst", False))
 
+def _check_absolute_dir(name, fun_args):
+    dir = fun_args.get(name)
+    if dir and not dir.startswith("/"):
+        import jinja2
+        raise jinja2.TemplateRuntimeError(name + " isn't absolute path")
+
 def _enter_to_build_dir_for_default_build_dir(default_build_dir, **fun_args):
     build_dir = fun_args.get("build_dir", default_build_dir)
     string = "{\n"
@@ -84,7 +125,15 @@ def leave_from_build_dir(**fun_args):
 
 default_functions["leave_from_build_dir"] = leave_from_build_dir
 
+def config_cache_key(*values):
+    import jinja2
+    new_values = map(lambda value: None if isinstance(value, jinja2.Undefined) else value, values)
+    return hashlib.sha1(json.dumps(new_values, sort_keys = True)).hexdigest()
+
+default_functions["config_cache_key"] = config_cache_key
+
 def configure_for_autoconf(args = [], env = {}, **other_fun_args):
+    _check_absolute_dir("config_cache_dir", other_fun_args)
     return _render_template("configure_for_autoconf.sh", args = args, env = env, **other_fun_args)
 
 default_functions["configure_for_autoconf"] = configure_for_autoconf
@@ -100,6 +149,7 @@ def leave_from_build_dir_for_autoconf(**fun_args):
 default_functions["leave_from_build_dir_for_autoconf"] = leave_from_build_dir_for_autoconf
 
 def configure_for_cmake(args = [], env = {}, **other_fun_args):
+    _check_absolute_dir("toolchain_cache_dir", other_fun_args)
     return _render_template("configure_for_cmake.sh", args = args, env = env, **other_fun_args)
 
 default_functions["configure_for_cmake"] = configure_for_cmake
@@ -130,33 +180,19 @@ def bsd_make(args = [], env = {}, **other_fun_args):
 default_functions["bsd_make"] = bsd_make
 
 def packages(package_collection_dir, category = None):
-    package_tree_dir = join(package_collection_dir, "packages")
-    if category != None:
-        package_dir = join(package_tree_dir, category.replace("/", sep))
-    else:
-        package_dir = package_tree_dir
-    package_paths = set([])
-    for dir, dirs, files in os.walk(package_dir):
-        for file in files:
-            tmp_file = join(dir, file)
-            if tmp_file.endswith(".info.yml"):
-                if isfile(tmp_file):
-                    if tmp_file.startswith(package_tree_dir):
-                        tmp_path = tmp_file[len(package_tree_dir):-9]
-                        if len(tmp_path) >= 1:
-                            if tmp_path[0] == sep:
-                                tmp_path = tmp_path[1:]
-                        package_paths.add(tmp_path.replace(sep, "/"))
-    return package_paths
+    _add_directory_read()
+    return package_index(join(package_collection_dir, "packages")).package_paths(category)
 
 default_functions["packages"] = packages
 
 def listdir(path):
+    _add_directory_read()
     return os.listdir(path.replace("/", sep))
 
 default_functions["listdir"] = listdir
 
 def walk(top, topdown = True, onerror = None, followlinks = False):
+    _add_directory_read()
     if re.match("^(2\\.[6-9](\\..+|)|[3-9](\\..+|)|[1-9][0-9](\\..+|))$", platform.python_version()):
         tuples = os.walk(top.replace("/", sep), topdown, onerror, followlinks)
     else:
@@ -19,6 +19,8 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+from array import array
+
 class Graph:
     def dfs(self, vertex_key, preorder_fun, postorder_fun, cycle_fun, marked_vertex_keys = set([])):
         if vertex_key in marked_vertex_keys:
@@ -49,3 +51,184 @@ class Graph:
                 preorder_fun(vertex.neighbor_key(i))
             else:
                 postorder_fun(vertex_key)
+
+class CompiledGraph:
+    def __init__(self, graph):
+        self.graph = graph
+        self.vertex_keys = []
+        self.vertex_ids = {}
+        self._offsets = array("l", [0])
+        self._neighbor_ids = array("l")
+        self._reversed_offsets = None
+        self._reversed_neighbor_ids = None
+
+    def vertex_count(self):
+        return len(self.vertex_keys)
+
+    def compiled_vertex_count(self):
+        return len(self._offsets) - 1
+
+    def vertex_id(self, vertex_key):
+        if vertex_key in self.vertex_ids:
+            return self.vertex_ids[vertex_key]
+        else:
+            vertex_id = len(self.vertex_keys)
+            self.vertex_keys.append(vertex_key)
+            self.vertex_ids[vertex_key] = vertex_id
+            return vertex_id
+
+    def neighbor_ids(self, vertex_id):
+        return self._neighbor_ids[self._offsets[vertex_id]:self._offsets[vertex_id + 1]]
+
+    def compile(self, vertex_keys):
+        vertex_count = self.vertex_count()
+        neighbor_count = len(self._neighbor_ids)
+        try:
+            vertex_ids = map(lambda vertex_key: self.vertex_id(vertex_key), vertex_keys)
+            while self.compiled_vertex_count() < self.vertex_count():
+                vertex = self.graph.vertex(self.vertex_keys[self.compiled_vertex_count()])
+                neighbor_ids = []
+                for i in range(0, vertex.neighbor_count()):
+                    neighbor_ids.append(self.vertex_id(vertex.neighbor_key(i)))
+                self._neighbor_ids.extend(neighbor_ids)
+                self._offsets.append(len(self._neighbor_ids))
+            return vertex_ids
+        except:
+            for vertex_key in self.vertex_keys[vertex_count:]:
+                del self.vertex_ids[vertex_key]
+            del self.vertex_keys[vertex_count:]
+            del self._offsets[vertex_count + 1:]
+            del self._neighbor_ids[neighbor_count:]
+            raise
+
+    def dependent_vertex_ids(self, vertex_ids):
+        if self._reversed_offsets == None or len(self._reversed_offsets) != len(self._offsets):
+            self._reverse()
+        offsets = self._reversed_offsets
+        neighbor_ids = self._reversed_neighbor_ids
+        is_visited = bytearray(self.compiled_vertex_count())
+        for vertex_id in vertex_ids:
+            is_visited[vertex_id] = 1
+        queue = list(vertex_ids)
+        dependent_vertex_ids = []
+        i = 0
+        while i < len(queue):
+            vertex_id = queue[i]
+            i += 1
+            for j in xrange(offsets[vertex_id], offsets[vertex_id + 1]):
+                if not is_visited[neighbor_ids[j]]:
+                    is_visited[neighbor_ids[j]] = 1
+                    queue.append(neighbor_ids[j])
+                    dependent_vertex_ids.append(neighbor_ids[j])
+        return dependent_vertex_ids
+
+    def _reverse(self):
+        vertex_count = self.compiled_vertex_count()
+        offsets = array("l", [0]) * (vertex_count + 1)
+        for neighbor_id in self._neighbor_ids:
+            offsets[neighbor_id + 1] += 1
+        for vertex_id in xrange(0, vertex_count):
+            offsets[vertex_id + 1] += offsets[vertex_id]
+        indices = array("l", offsets)
+        neighbor_ids = array("l", [0]) * len(self._neighbor_ids)
+        for vertex_id in xrange(0, vertex_count):
+            for i in xrange(self._offsets[vertex_id], self._offsets[vertex_id + 1]):
+                neighbor_ids[indices[self._neighbor_ids[i]]] = vertex_id
+                indices[self._neighbor_ids[i]] += 1
+        self._reversed_offsets = offsets
+        self._reversed_neighbor_ids = neighbor_ids
+
+    def strongly_connected_components(self, vertex_ids = None):
+        if vertex_ids == None:
+            vertex_ids = range(0, self.compiled_vertex_count())
+        offsets = self._offsets
+        neighbor_ids = self._neighbor_ids
+        indices = array("l", [-1]) * self.compiled_vertex_count()
+        low_links = array("l", [0]) * self.compiled_vertex_count()
+        is_on_stack = bytearray(self.compiled_vertex_count())
+        stack = array("l")
+        components = []
+        next_index = 0
+        for root_id in vertex_ids:
+            if indices[root_id] != -1:
+                continue
+            path_vertex_ids = array("l", [root_id])
+            path_indices = array("l", [offsets[root_id]])
+            indices[root_id] = next_index
+            low_links[root_id] = next_index
+            next_index += 1
+            stack.append(root_id)
+            is_on_stack[root_id] = 1
+            while len(path_vertex_ids) > 0:
+                vertex_id = path_vertex_ids[-1]
+                i = path_indices[-1]
+                end = offsets[vertex_id + 1]
+                while i < end:
+                    if indices[neighbor_ids[i]] == -1:
+                        break
+                    elif is_on_stack[neighbor_ids[i]] and indices[neighbor_ids[i]] < low_links[vertex_id]:
+                        low_links[vertex_id] = indices[neighbor_ids[i]]
+                    i += 1
+                if i < end:
+                    path_indices[-1] = i + 1
+                    neighbor_id = neighbor_ids[i]
+                    path_vertex_ids.append(neighbor_id)
+                    path_indices.append(offsets[neighbor_id])
+                    indices[neighbor_id] = next_index
+                    low_links[neighbor_id] = next_index
+                    next_index += 1
+                    stack.append(neighbor_id)
+                    is_on_stack[neighbor_id] = 1
+                else:
+                    path_vertex_ids.pop()
+                    path_indices.pop()
+                    if len(path_vertex_ids) > 0 and low_links[vertex_id] < low_links[path_vertex_ids[-1]]:
+                        low_links[path_vertex_ids[-1]] = low_links[vertex_id]
+                    if low_links[vertex_id] == indices[vertex_id]:
+                        component = []
+                        while True:
+                            component_vertex_id = stack.pop()
+                            is_on_stack[component_vertex_id] = 0
+                            component.append(component_vertex_id)
+                            if component_vertex_id == vertex_id:
+                                break
+                        components.append(component)
+        return components
+
+    def dfs(self, vertex_id, preorder_fun, postorder_fun, cycle_fun, vertex_states):
+        if len(vertex_states) < self.vertex_count():
+            vertex_states.extend(bytearray(self.vertex_count() - len(vertex_states)))
+        if vertex_states[vertex_id] != 0:
+            return
+        offsets = self._offsets
+        neighbor_ids = self._neighbor_ids
+        vertex_ids = array("l", [vertex_id])
+        indices = array("l", [offsets[vertex_id]])
+        vertex_states[vertex_id] = 1
+        try:
+            preorder_fun(vertex_id)
+            while len(vertex_ids) > 0:
+                vertex_id = vertex_ids[-1]
+                i = indices[-1]
+                end = offsets[vertex_id + 1]
+                while i < end:
+                    if vertex_states[neighbor_ids[i]] == 0:
+                        break
+                    elif vertex_states[neighbor_ids[i]] == 1:
+                        if not cycle_fun(vertex_id, neighbor_ids[i]):
+                            return
+                    i += 1
+                if i < end:
+                    indices[-1] = i + 1
+                    vertex_ids.append(neighbor_ids[i])
+                    indices.append(offsets[neighbor_ids[i]])
+                    vertex_states[neighbor_ids[i]] = 1
+                    preorder_fun(neighbor_ids[i])
+                else:
+                    vertex_ids.pop()
+                    indices.pop()
+                    vertex_states[vertex_id] = 2
+                    postorder_fun(vertex_id)
+        finally:
+            for vertex_id in vertex_ids:
+                vertex_states[vertex_id] = 2
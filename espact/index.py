@@ -0,0 +1,190 @@
+# -*- coding: UTF-8 -*-
+# Copyright (c) 2018 Łukasz Szpakowski
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+from errno import EEXIST
+from os.path import dirname, isfile, join, realpath
+from os import getpid, listdir, lstat, makedirs, remove, rename, sep, stat
+from stat import S_ISDIR, S_ISLNK, S_ISREG
+import threading
+import time
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+_PACKAGE_INDEX_VERSION = 1
+
+def _scan_dir(dir):
+    names = []
+    dir_names = []
+    if scandir != None:
+        for entry in scandir(dir):
+            if entry.is_dir(follow_symlinks = False):
+                dir_names.append(entry.name)
+            elif entry.name.endswith(".info.yml") and entry.is_file():
+                names.append(entry.name[0:-9])
+    else:
+        for name in listdir(dir):
+            file = join(dir, name)
+            file_stat = lstat(file)
+            if S_ISDIR(file_stat.st_mode):
+                dir_names.append(name)
+            elif name.endswith(".info.yml"):
+                if S_ISREG(file_stat.st_mode) or (S_ISLNK(file_stat.st_mode) and isfile(file)):
+                    names.append(name[0:-9])
+    return names, dir_names
+
+class PackageIndex:
+    def __init__(self, dir, file = None):
+        self.dir = dir
+        self.file = file
+        self._dirs = None
+        self._is_updated = False
+        self._lock = threading.Lock()
+
+    def package_paths(self, category = None):
+        self._lock.acquire()
+        try:
+            if not self._is_updated:
+                self._update()
+            package_paths = set([])
+            if category != None:
+                category = category.strip("/")
+            if category != None and category != "":
+                self._add_package_paths(category, package_paths)
+            else:
+                self._add_package_paths("", package_paths)
+            return package_paths
+        finally:
+            self._lock.release()
+
+    def invalidate(self):
+        self._lock.acquire()
+        try:
+            self._is_updated = False
+        finally:
+            self._lock.release()
+
+    def _add_package_paths(self, rel_dir, package_paths):
+        if rel_dir not in self._dirs:
+            return
+        mtime, scan_time, names, dir_names = self._dirs[rel_dir]
+        for name in names:
+            if rel_dir != "":
+                package_paths.add(rel_dir + "/" + name)
+            else:
+                package_paths.add(name)
+        for dir_name in dir_names:
+            if rel_dir != "":
+                self._add_package_paths(rel_dir + "/" + dir_name, package_paths)
+            else:
+                self._add_package_paths(dir_name, package_paths)
+
+    def _update(self):
+        if self._dirs == None:
+            self._dirs = self._load()
+        new_dirs = {}
+        self._update_dir("", new_dirs, time.time())
+        if new_dirs != self._dirs:
+            self._dirs = new_dirs
+            self._save()
+        self._is_updated = True
+
+    def _update_dir(self, rel_dir, new_dirs, scan_time):
+        dir = join(self.dir, rel_dir.replace("/", sep))
+        try:
+            mtime = stat(dir).st_mtime
+        except OSError:
+            return
+        entry = self._dirs.get(rel_dir)
+        if entry != None and entry[0] == mtime and mtime < entry[1] - 1.0:
+            new_dirs[rel_dir] = entry
+        else:
+            try:
+                names, dir_names = _scan_dir(dir)
+            except OSError:
+                return
+            new_dirs[rel_dir] = (mtime, scan_time, sorted(names), sorted(dir_names))
+        for dir_name in new_dirs[rel_dir][3]:
+            if rel_dir != "":
+                self._update_dir(rel_dir + "/" + dir_name, new_dirs, scan_time)
+            else:
+                self._update_dir(dir_name, new_dirs, scan_time)
+
+    def _load(self):
+        if self.file == None:
+            return {}
+        try:
+            stream = open(self.file, "rb")
+            try:
+                version, dir, dirs = pickle.load(stream)
+            finally:
+                stream.close()
+        except (IOError, OSError, EOFError, ValueError, TypeError, AttributeError, ImportError, pickle.UnpicklingError):
+            return {}
+        if version != _PACKAGE_INDEX_VERSION or dir != self.dir or not isinstance(dirs, dict):
+            return {}
+        return dirs
+
+    def _save(self):
+        if self.file == None:
+            return
+        tmp_file = self.file + "." + str(getpid()) + ".tmp"
+        try:
+            try:
+                makedirs(dirname(self.file))
+            except OSError as e:
+                if e.errno != EEXIST:
+                    raise
+            stream = open(tmp_file, "wb")
+            try:
+                pickle.dump((_PACKAGE_INDEX_VERSION, self.dir, self._dirs), stream, pickle.HIGHEST_PROTOCOL)
+            finally:
+                stream.close()
+            rename(tmp_file, self.file)
+        except (IOError, OSError, pickle.PicklingError):
+            try:
+                remove(tmp_file)
+            except OSError:
+                pass
+
+_package_indexes = {}
+_package_index_lock = threading.Lock()
+
+def package_index(dir, file = None):
+    dir = realpath(dir)
+    _package_index_lock.acquire()
+    try:
+        if dir not in _package_indexes:
+            _package_indexes[dir] = PackageIndex(dir, file)
+        elif file != None and _package_indexes[dir].file == None:
+            _package_indexes[dir].file = file
+        return _package_indexes[dir]
+    finally:
+        _package_index_lock.release()
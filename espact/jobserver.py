@@ -0,0 +1,79 @@
+# -*- coding: UTF-8 -*-
+# Copyright (c) 2018 Łukasz Szpakowski
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+from errno import EAGAIN, EINTR
+import os
+import select
+
+__all__ = ["JobServer"]
+
+class JobServer:
+    def __init__(self, jobs, environ = None):
+        self.jobs = jobs
+        self.environ = environ
+        self.read_fd, self.write_fd = os.pipe()
+        if hasattr(os, "set_inheritable"):
+            os.set_inheritable(self.read_fd, True)
+            os.set_inheritable(self.write_fd, True)
+        if jobs > 1:
+            os.write(self.write_fd, b"+" * (jobs - 1))
+
+    def acquire(self):
+        while True:
+            try:
+                return os.read(self.read_fd, 1)
+            except OSError as e:
+                if e.errno == EAGAIN:
+                    self._wait_for_token()
+                elif e.errno != EINTR:
+                    raise
+
+    def _wait_for_token(self):
+        try:
+            select.select([self.read_fd], [], [])
+        except select.error as e:
+            if e.args[0] != EINTR:
+                raise
+
+    def release(self, token):
+        while True:
+            try:
+                os.write(self.write_fd, token)
+                return
+            except OSError as e:
+                if e.errno != EINTR:
+                    raise
+
+    def env(self):
+        fds = str(self.read_fd) + "," + str(self.write_fd)
+        if self.environ != None:
+            makeflags = self.environ.get("MAKEFLAGS", "")
+        else:
+            makeflags = os.environ.get("MAKEFLAGS", "")
+        return {
+            "MAKEFLAGS": (makeflags + " -j --jobserver-fds=" + fds + " --jobserver-auth=" + fds).strip(),
+            "ESPACT_SAVED_MAKEFLAGS": makeflags
+        }
+
+    def close(self):
+        os.close(self.read_fd)
+        os.close(self.write_fd)
@@ -0,0 +1,49 @@
+# -*- coding: UTF-8 -*-
+# Copyright (c) 2018 Łukasz Szpakowski
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import jinja2
+import jinja2.meta
+
+class TemplateLoader(jinja2.BaseLoader):
+    def __init__(self, loader):
+        self.loader = loader
+        self.template_files = {}
+        self._template_sources = {}
+        self._template_names = {}
+
+    def get_source(self, environment, template):
+        source, file, uptodate = self.loader.get_source(environment, template)
+        self.template_files[template] = file
+        self._template_sources[template] = source
+        if template in self._template_names:
+            del self._template_names[template]
+        return source, file, uptodate
+
+    def list_templates(self):
+        return self.loader.list_templates()
+
+    def referenced_template_names(self, environment, template):
+        if template not in self._template_names:
+            source = self._template_sources[template]
+            names = list(jinja2.meta.find_referenced_templates(environment.parse(source, template, self.template_files[template])))
+            self._template_names[template] = names
+        return self._template_names[template]
@@ -0,0 +1,89 @@
+# -*- coding: UTF-8 -*-
+# Copyright (c) 2018 Łukasz Szpakowski
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+from collections import deque
+from errno import EEXIST
+from os.path import dirname
+from os import makedirs
+
+__all__ = ["CommandLog"]
+
+class CommandLog:
+    def __init__(self, file, can_compress = False, max_size = None, tail_size = 16384):
+        self.file = file
+        self.can_compress = can_compress
+        self.max_size = max_size
+        self.tail_size = tail_size
+        self.size = 0
+        self.written_size = 0
+        self.is_broken = False
+        self._chunks = deque()
+        self._chunk_size = 0
+        try:
+            makedirs(dirname(file))
+        except OSError as e:
+            if e.errno != EEXIST:
+                raise
+        if can_compress:
+            import gzip
+            self._stream = gzip.open(file, "wb", 1)
+        else:
+            self._stream = open(file, "wb")
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_size == None or self.written_size < self.max_size:
+            if self.max_size != None and self.written_size + len(data) > self.max_size:
+                data_to_write = data[:self.max_size - self.written_size]
+            else:
+                data_to_write = data
+            try:
+                self._stream.write(data_to_write)
+            except (IOError, OSError):
+                self.is_broken = True
+                raise
+            self.written_size += len(data_to_write)
+        if self.tail_size > 0:
+            self._chunks.append(data)
+            self._chunk_size += len(data)
+            while self._chunk_size - len(self._chunks[0]) >= self.tail_size:
+                self._chunk_size -= len(self._chunks.popleft())
+
+    def fileno(self):
+        return self._stream.fileno()
+
+    def tail(self):
+        if self.tail_size > 0:
+            return "".join(self._chunks)[-self.tail_size:]
+        else:
+            return ""
+
+    def close(self):
+        if self.is_broken:
+            try:
+                self._stream.close()
+            except (IOError, OSError):
+                pass
+            return
+        if self.written_size < self.size:
+            self._stream.write("\n*** Log was truncated after " + str(self.written_size) + " of " + str(self.size) + " bytes\n")
+        self._stream.close()
@@ -19,11 +19,19 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+from heapq import heappop, heappush
 from os.path import isfile
-from espact.exceptions import UnmakingTargetException, CommandFailureException, NoRequiredTargetException
+import threading
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+from espact.exceptions import EspactException, UnmakingTargetException, CommandFailureException, NoRequiredTargetException
 from espact.graph import *
 from espact.package import *
 
+__all__ = ["Maker"]
+
 class _TargetVertex:
     def __init__(self, package, name, package_path):
         self.package = package
@@ -51,7 +59,7 @@ class _TargetGraph(Graph):
         return _TargetVertex(package, vertex_key.name, vertex_key.package_path)
 
 class Maker:
-    def __init__(self, package_collection, pre_make_fun = lambda vertex_key, is_made_target: None, post_make_fun = lambda vertex_key, is_prev_made_target: None, cycle_fun = lambda vertex_key1, vertex_key2: None, is_fake = False, can_add_made_target = True, can_create_made_target_file = True):
+    def __init__(self, package_collection, pre_make_fun = lambda vertex_key, is_made_target: None, post_make_fun = lambda vertex_key, is_prev_made_target: None, cycle_fun = lambda vertex_key1, vertex_key2: None, is_fake = False, can_add_made_target = True, can_create_made_target_file = True, jobs = 1, job_server = None, can_use_signatures = False, artifact_cache = None, can_keep_going = False, cpu_budget = None, mem_budget = None, can_track_templates = False):
         self.package_collection = package_collection
         self.pre_make_fun = pre_make_fun
         self.post_make_fun = post_make_fun
@@ -59,70 +67,391 @@ class Maker:
         self.is_fake = is_fake
         self.can_add_made_target = can_add_made_target
         self.can_create_made_target_file = can_create_made_target_file
-        self._graph = _TargetGraph(self.package_collection)
-        self._marked_vertex_keys = set([])
+        self.jobs = jobs
+        self.job_server = job_server
+        self.can_use_signatures = can_use_signatures
+        self.artifact_cache = artifact_cache
+        self.can_keep_going = can_keep_going
+        self.cpu_budget = cpu_budget
+        self.mem_budget = mem_budget
+        self.can_track_templates = can_track_templates
+        self.failed_targets = []
+        self.blocked_targets = []
+        self._graph = CompiledGraph(_TargetGraph(self.package_collection))
+        self._vertex_states = bytearray()
 
     def make(self, target):
-        self._graph.dfs(target,
-            lambda vertex_key: None,
-            lambda vertex_key: self._postorder(vertex_key),
-            lambda vertex_key1, vertex_key2: self._cycle(vertex_key1, vertex_key2),
-            self._marked_vertex_keys)
+        self.make_targets([target])
+
+    def make_targets(self, targets):
+        try:
+            if self.jobs > 1 or self.can_keep_going:
+                self._make_targets_in_parallel(targets)
+            else:
+                for target in targets:
+                    self._dfs(target, lambda vertex_id: self._postorder(self._graph.vertex_keys[vertex_id]))
+        finally:
+            self.package_collection.flush_made_targets()
 
     def clear_marked_vertex_keys(self):
-        self._marked_vertex_keys = set([])
+        self._vertex_states = bytearray()
+
+    def get_critical_path(self, targets):
+        ordered_vertex_ids = []
+        vertex_states = bytearray()
+        for target in targets:
+            vertex_id = self._graph.compile([target])[0]
+            self._graph.dfs(vertex_id,
+                lambda vertex_id: None,
+                lambda vertex_id: ordered_vertex_ids.append(vertex_id),
+                lambda vertex_id1, vertex_id2: self._cycle(self._graph.vertex_keys[vertex_id1], self._graph.vertex_keys[vertex_id2]),
+                vertex_states)
+        wall_times = {}
+        path_times = {}
+        next_vertex_ids = {}
+        for vertex_id in ordered_vertex_ids:
+            record = self.package_collection.get_command_record(self._graph.vertex_keys[vertex_id])
+            if record != None:
+                wall_times[vertex_id] = record.wall_time
+            else:
+                wall_times[vertex_id] = 0.0
+            next_vertex_ids[vertex_id] = None
+            for req_id in self._graph.neighbor_ids(vertex_id):
+                if req_id in path_times:
+                    if next_vertex_ids[vertex_id] == None or path_times[req_id] > path_times[next_vertex_ids[vertex_id]]:
+                        next_vertex_ids[vertex_id] = req_id
+            if next_vertex_ids[vertex_id] != None:
+                path_times[vertex_id] = wall_times[vertex_id] + path_times[next_vertex_ids[vertex_id]]
+            else:
+                path_times[vertex_id] = wall_times[vertex_id]
+        path = []
+        if ordered_vertex_ids != []:
+            vertex_id = max(ordered_vertex_ids, key = lambda vertex_id: path_times[vertex_id])
+            while vertex_id != None:
+                path.append((self._graph.vertex_keys[vertex_id], wall_times[vertex_id]))
+                vertex_id = next_vertex_ids[vertex_id]
+        path.reverse()
+        return path
+
+    def get_cycles(self, targets):
+        span = self.package_collection.profiler.begin("get_cycles", "graph")
+        try:
+            vertex_ids = self._graph.compile(list(targets))
+            cycles = []
+            for component in self._graph.strongly_connected_components(vertex_ids):
+                if len(component) > 1 or component[0] in self._graph.neighbor_ids(component[0]):
+                    cycles.append(sorted(map(lambda vertex_id: self._graph.vertex_keys[vertex_id], component)))
+            return sorted(cycles)
+        finally:
+            self.package_collection.profiler.end(span)
+
+    def get_dependent_targets(self, targets, all_targets):
+        span = self.package_collection.profiler.begin("get_dependent_targets", "graph")
+        try:
+            self._graph.compile(list(all_targets))
+            vertex_ids = self._graph.compile(list(targets))
+            return sorted(map(lambda vertex_id: self._graph.vertex_keys[vertex_id], self._graph.dependent_vertex_ids(vertex_ids)))
+        finally:
+            self.package_collection.profiler.end(span)
+
+    def _dfs(self, target, postorder_fun):
+        span = self.package_collection.profiler.begin(str(target), "graph")
+        try:
+            vertex_id = self._graph.compile([target])[0]
+        finally:
+            self.package_collection.profiler.end(span)
+        self._graph.dfs(vertex_id,
+            lambda vertex_id: None,
+            postorder_fun,
+            lambda vertex_id1, vertex_id2: self._cycle(self._graph.vertex_keys[vertex_id1], self._graph.vertex_keys[vertex_id2]),
+            self._vertex_states)
 
     def _postorder(self, vertex_key):
+        if self._must_make(vertex_key):
+            targets_to_unmake = self._start_making(vertex_key)
+            if not self.is_fake:
+                status = self._run_rule_command(vertex_key)
+            else:
+                status = 0
+            self._finish_making(vertex_key, targets_to_unmake, status)
+        else:
+            self.pre_make_fun(vertex_key, True)
+            self.post_make_fun(vertex_key, True)
+
+    def _must_make(self, vertex_key):
         if self.package_collection.has_unmaking_target(vertex_key):
             raise UnmakingTargetException(vertex_key)
-        if not self._graph.vertex(vertex_key).package.rules[vertex_key.name].phony:
+        if not self._rule(vertex_key).phony:
             made_target_time = self.package_collection.get_made_target_time(vertex_key)
             if made_target_time == None:
-                must_make = True
+                return True
             else:
-                package = self.package_collection.get_package(vertex_key.package_path)
-                must_make = False
-                for target in package.rules[vertex_key.name].reqs:
+                is_same_signature = None
+                if self.can_use_signatures:
+                    is_same_signature = self._has_same_signature(vertex_key)
+                    if is_same_signature == False:
+                        return True
+                if self.can_track_templates and is_same_signature != True and self._has_same_template_fingerprint(vertex_key) == False:
+                    return True
+                for target in self._rule(vertex_key).reqs:
                     required_made_target_time = self.package_collection.get_made_target_time(target)
-                    if self.package_collection.get_package(target.package_path).rules[target.name].phony:
+                    if self._rule(target).phony:
                         required_made_target_time = None
                     if required_made_target_time == None or required_made_target_time == "unmaking" or required_made_target_time > made_target_time:
-                        must_make = True
-                        break
+                        return True
+                return False
         else:
-            must_make = True
-        if must_make:
-            self.pre_make_fun(vertex_key, False)
-            targets_to_unmake = self._get_targets_to_unmake(vertex_key)
+            return True
+
+    def _start_making(self, vertex_key):
+        self.pre_make_fun(vertex_key, False)
+        targets_to_unmake = self._get_targets_to_unmake(vertex_key)
+        if not self.is_fake:
+            has_unmaking_target = False
+            for target_to_unmake in targets_to_unmake:
+                if self.package_collection.has_made_target(target_to_unmake):
+                    self.package_collection.add_made_target(target_to_unmake, self.can_create_made_target_file, True)
+                    has_unmaking_target = True
+            if has_unmaking_target:
+                self.package_collection.flush_made_targets()
+        return targets_to_unmake
+
+    def _finish_making(self, vertex_key, targets_to_unmake, status):
+        if status == 0:
             if not self.is_fake:
                 for target_to_unmake in targets_to_unmake:
                     if self.package_collection.has_made_target(target_to_unmake):
-                        self.package_collection.add_made_target(target_to_unmake, self.can_create_made_target_file, True)
-                status = self.package_collection.execute_rule_command(vertex_key)
-            else:
-                status = 0
-            if status == 0:
-                if not self.is_fake:
-                    for target_to_unmake in targets_to_unmake:
-                        if self.package_collection.has_made_target(target_to_unmake):
-                            self.package_collection.remove_made_target(target_to_unmake)
-                if self.can_add_made_target and (not self._graph.vertex(vertex_key).package.rules[vertex_key.name].phony):
-                    self.package_collection.add_made_target(vertex_key, self.can_create_made_target_file)
+                        self.package_collection.remove_made_target(target_to_unmake)
+            if self.can_add_made_target and (not self._rule(vertex_key).phony):
+                self.package_collection.add_made_target(vertex_key, self.can_create_made_target_file)
+                if self.can_use_signatures and self.can_create_made_target_file:
+                    signature = self.package_collection.compute_target_signature(vertex_key)
+                    if signature != None:
+                        self.package_collection.add_target_signature(vertex_key, signature)
+                if self.can_track_templates and self.can_create_made_target_file:
+                    fingerprint = self.package_collection.compute_package_template_fingerprint(vertex_key.package_path)
+                    if fingerprint != None:
+                        self.package_collection.add_target_template_fingerprint(vertex_key, fingerprint)
+        else:
+            raise CommandFailureException(vertex_key, status)
+        self.post_make_fun(vertex_key, False)
+
+    def _make_targets_in_parallel(self, targets):
+        req_counts = {}
+        made_vertex_ids = set([])
+        dependent_vertex_ids = {}
+        ready_vertex_ids = []
+        results = Queue()
+        running_count = 0
+        is_exclusive = False
+        is_implicit_token_used = False
+        failed_vertex_ids = set([])
+        running_weights = {}
+        running_cpu = 0
+        running_mem = 0
+        deferred_vertex_ids = []
+        exception = None
+        ordered_vertex_ids = []
+        for target in targets:
+            try:
+                self._add_target_vertex_ids(target, req_counts, dependent_vertex_ids, ordered_vertex_ids)
+            except EspactException as e:
+                if self.can_keep_going:
+                    self.failed_targets.append((target, e))
+                else:
+                    exception = e
+                    break
+        if self.jobs > 1:
+            priorities = self._get_critical_path_priorities(ordered_vertex_ids, dependent_vertex_ids)
+        else:
+            priorities = dict(map(lambda i: (ordered_vertex_ids[i], i), range(len(ordered_vertex_ids))))
+        for vertex_id in ordered_vertex_ids:
+            if req_counts[vertex_id] == 0:
+                heappush(ready_vertex_ids, (priorities[vertex_id], vertex_id))
+        while running_count > 0 or (exception == None and len(ready_vertex_ids) > 0):
+            while exception == None and len(ready_vertex_ids) > 0 and running_count < self.jobs and not is_exclusive:
+                vertex_id = ready_vertex_ids[0][1]
+                target = self._graph.vertex_keys[vertex_id]
+                if running_count > 0 and self._get_targets_to_unmake(target) != []:
+                    break
+                ready_vertex_id = heappop(ready_vertex_ids)
+                try:
+                    if self._must_make(target):
+                        if not self.is_fake and running_count > 0 and not self._has_enough_resources(target, running_cpu, running_mem):
+                            deferred_vertex_ids.append(ready_vertex_id)
+                            continue
+                        targets_to_unmake = self._start_making(target)
+                        if not self.is_fake:
+                            thread = threading.Thread(target = self._execute_rule_command, args = (vertex_id, targets_to_unmake, not is_implicit_token_used, results))
+                            thread.daemon = True
+                            thread.start()
+                            running_weights[vertex_id] = (self._rule(target).cpu, self._rule(target).mem)
+                            running_cpu += self._rule(target).cpu
+                            running_mem += self._rule(target).mem
+                            running_count += 1
+                            is_implicit_token_used = True
+                            is_exclusive = (targets_to_unmake != [])
+                            continue
+                        self._finish_making(target, targets_to_unmake, 0)
+                    else:
+                        self.pre_make_fun(target, True)
+                        self.post_make_fun(target, True)
+                    made_vertex_ids.add(vertex_id)
+                    self._add_ready_vertex_ids(vertex_id, req_counts, dependent_vertex_ids, priorities, ready_vertex_ids)
+                except EspactException as e:
+                    if self.can_keep_going:
+                        self.failed_targets.append((target, e))
+                        failed_vertex_ids.add(vertex_id)
+                    else:
+                        exception = e
+            if running_count > 0:
+                vertex_id, targets_to_unmake, has_implicit_token, status, e = results.get()
+                running_count -= 1
+                cpu, mem = running_weights.pop(vertex_id)
+                running_cpu -= cpu
+                running_mem -= mem
+                for ready_vertex_id in deferred_vertex_ids:
+                    heappush(ready_vertex_ids, ready_vertex_id)
+                deferred_vertex_ids = []
+                if has_implicit_token:
+                    is_implicit_token_used = False
+                is_exclusive = False
+                if e == None:
+                    try:
+                        self._finish_making(self._graph.vertex_keys[vertex_id], targets_to_unmake, status)
+                        made_vertex_ids.add(vertex_id)
+                        self._add_ready_vertex_ids(vertex_id, req_counts, dependent_vertex_ids, priorities, ready_vertex_ids)
+                    except EspactException as finish_exception:
+                        e = finish_exception
+                if e != None:
+                    if self.can_keep_going and isinstance(e, EspactException):
+                        self.failed_targets.append((self._graph.vertex_keys[vertex_id], e))
+                        failed_vertex_ids.add(vertex_id)
+                    elif exception == None:
+                        exception = e
+        if exception != None:
+            raise exception
+        if self.can_keep_going:
+            for vertex_id in sorted(req_counts.keys(), key = lambda vertex_id: self._graph.vertex_keys[vertex_id]):
+                if vertex_id not in made_vertex_ids and vertex_id not in failed_vertex_ids:
+                    self.blocked_targets.append(self._graph.vertex_keys[vertex_id])
+
+    def _has_enough_resources(self, target, running_cpu, running_mem):
+        rule = self._rule(target)
+        if self.cpu_budget != None and rule.cpu > 0 and running_cpu + rule.cpu > self.cpu_budget:
+            return False
+        if self.mem_budget != None and rule.mem > 0 and running_mem + rule.mem > self.mem_budget:
+            return False
+        return True
+
+    def _execute_rule_command(self, vertex_id, targets_to_unmake, has_implicit_token, results):
+        try:
+            if self.job_server != None and not has_implicit_token:
+                token = self.job_server.acquire()
+                try:
+                    status = self._run_rule_command(self._graph.vertex_keys[vertex_id])
+                finally:
+                    self.job_server.release(token)
             else:
-                raise CommandFailureException(vertex_key, status)
-            self.post_make_fun(vertex_key, False)
+                status = self._run_rule_command(self._graph.vertex_keys[vertex_id])
+            results.put((vertex_id, targets_to_unmake, has_implicit_token, status, None))
+        except Exception as e:
+            results.put((vertex_id, targets_to_unmake, has_implicit_token, None, e))
+
+    def _run_rule_command(self, target):
+        outputs = self._rule(target).outputs
+        artifact_key = None
+        is_forced_target = self.package_collection.has_forced_target(target)
+        if self.artifact_cache != None and outputs != []:
+            artifact_key = self.package_collection.compute_artifact_key(target)
+            if artifact_key != None and not is_forced_target and self.artifact_cache.restore(artifact_key, self.package_collection.work_dir, outputs):
+                return 0
+        status = self.package_collection.execute_rule_command(target, self._get_command_env())
+        if status == 0:
+            if artifact_key != None:
+                self.artifact_cache.store(artifact_key, self.package_collection.work_dir, outputs)
+            if is_forced_target:
+                self.package_collection.remove_forced_target(target)
+        return status
+
+    def _get_command_env(self):
+        if self.job_server != None:
+            return self.job_server.env()
         else:
-            self.pre_make_fun(vertex_key, True)
-            self.post_make_fun(vertex_key, True)
+            return None
+
+    def _add_target_vertex_ids(self, target, req_counts, dependent_vertex_ids, ordered_vertex_ids):
+        target_vertex_ids = []
+        try:
+            self._dfs(target, lambda vertex_id: target_vertex_ids.append(vertex_id))
+        finally:
+            for vertex_id in target_vertex_ids:
+                req_ids = set(filter(lambda req_id: req_id in req_counts, self._graph.neighbor_ids(vertex_id)))
+                req_counts[vertex_id] = len(req_ids)
+                for req_id in req_ids:
+                    dependent_vertex_ids.setdefault(req_id, []).append(vertex_id)
+            ordered_vertex_ids.extend(target_vertex_ids)
+
+    def _add_ready_vertex_ids(self, vertex_id, req_counts, dependent_vertex_ids, priorities, ready_vertex_ids):
+        for dependent_vertex_id in dependent_vertex_ids.get(vertex_id, []):
+            req_counts[dependent_vertex_id] -= 1
+            if req_counts[dependent_vertex_id] == 0:
+                heappush(ready_vertex_ids, (priorities[dependent_vertex_id], dependent_vertex_id))
+
+    def _get_critical_path_priorities(self, ordered_vertex_ids, dependent_vertex_ids):
+        wall_times = {}
+        for vertex_id in ordered_vertex_ids:
+            record = self.package_collection.get_command_record(self._graph.vertex_keys[vertex_id])
+            if record != None:
+                wall_times[vertex_id] = record.wall_time
+        if len(wall_times) > 0:
+            default_wall_time = sum(wall_times.values()) / len(wall_times)
+        else:
+            default_wall_time = 1.0
+        path_times = {}
+        priorities = {}
+        for i in range(len(ordered_vertex_ids) - 1, -1, -1):
+            vertex_id = ordered_vertex_ids[i]
+            path_time = 0.0
+            for dependent_vertex_id in dependent_vertex_ids.get(vertex_id, []):
+                path_time = max(path_time, path_times[dependent_vertex_id])
+            path_times[vertex_id] = wall_times.get(vertex_id, default_wall_time) + path_time
+            priorities[vertex_id] = (-path_times[vertex_id], i)
+        return priorities
+
+    def _has_same_signature(self, target):
+        new_signature = self.package_collection.compute_target_signature(target)
+        if new_signature == None:
+            return None
+        signature = self.package_collection.get_target_signature(target)
+        if signature == None:
+            if self.can_add_made_target and self.can_create_made_target_file:
+                self.package_collection.add_target_signature(target, new_signature)
+            return None
+        return signature == new_signature
+
+    def _has_same_template_fingerprint(self, target):
+        new_fingerprint = self.package_collection.compute_package_template_fingerprint(target.package_path)
+        if new_fingerprint == None:
+            return None
+        fingerprint = self.package_collection.get_target_template_fingerprint(target)
+        if fingerprint == None:
+            if self.can_add_made_target and self.can_create_made_target_file:
+                self.package_collection.add_target_template_fingerprint(target, new_fingerprint)
+            return None
+        return fingerprint == new_fingerprint
 
     def _cycle(self, vertex_key1, vertex_key2):
         self.cycle_fun(vertex_key1, vertex_key2)
         return False
 
+    def _rule(self, target):
+        return self.package_collection.get_package(target.package_path).rules[target.name]
+
     def _get_targets_to_unmake(self, target):
-        if isinstance(self.package_collection.get_package(target.package_path).rules[target.name].unmake, list):
-            return self.package_collection.get_package(target.package_path).rules[target.name].unmake
-        elif self.package_collection.get_package(target.package_path).rules[target.name].unmake == True:
+        if isinstance(self._rule(target).unmake, list):
+            return self._rule(target).unmake
+        elif self._rule(target).unmake == True:
             return map(lambda target_name: make_target(target.package_path, target_name), self.package_collection.get_package(target.package_path).rules.keys())
         else:
             return []
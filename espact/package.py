@@ -20,22 +20,38 @@
 # THE SOFTWARE.
 
 from datetime import datetime
-from errno import EEXIST, ENOENT
+from errno import EAGAIN, EEXIST, EINTR, ENOENT, EPIPE
+import hashlib
+from itertools import izip
+import os
 from os.path import dirname, isfile, join, realpath
-from os import makedirs, pipe, remove, sep, walk
+from os import makedirs, pipe, remove, rename, sep, stat
 import platform
 import re
-import subprocess
 import sys
+import threading
+import time
 import traceback
-import jinja2
-import yaml
-from espact.exceptions import CommandErrorException, NoPackageException, PackageException, TargetException
-from espact.exceptions import TemplateException, exception_to_package_exception
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+import json
+from espact.artifacts import path_digest
+from espact.exceptions import CommandErrorException, EspactException, NoPackageException, PackageException
+from espact.exceptions import TemplateException, exception_to_package_exception, exception_to_template_compilation_exception
 from espact.filters import default_filters
-from espact.functions import default_functions
+from espact.functions import default_functions, set_bytecode_cache, _directory_read_count
+from espact.functions import compile_templates as compile_function_templates
+from espact.functions import template_files as function_template_files
+from espact.index import package_index
+from espact.logs import CommandLog
+from espact.profiler import NullProfiler
+from espact.store import CommandHistory, CommandRecord, MadeTargetFileStore, SignatureStore, made_target_store
 from espact.variables import default_variables
 
+__all__ = ["Target", "make_target", "Rule", "Package", "PackageCollection", "dump_yaml", "dump_json"]
+
 def _string_without_newline(string):
     if string != "":
         if string[-1] == "\n":
@@ -45,13 +61,60 @@ def _string_without_newline(string):
     else:
         return string
 
+_jinja2 = None
+_yaml = None
+_YamlDumper = None
+_YamlLoader = None
+_yaml_representers = []
+
+def _import_jinja2():
+    global _jinja2
+    if _jinja2 == None:
+        import jinja2
+        import jinja2.meta
+        _jinja2 = jinja2
+
+def _import_yaml():
+    global _yaml, _YamlDumper, _YamlLoader
+    if _yaml == None:
+        import yaml
+        try:
+            from yaml import CDumper as dumper, CLoader as loader
+        except ImportError:
+            from yaml import Dumper as dumper, Loader as loader
+        _YamlDumper = type("_YamlDumper", (dumper,), {})
+        _register_yaml_representers(_YamlDumper)
+        _YamlLoader = loader
+        _yaml = yaml
+
+def _add_yaml_representer(data_type, representer):
+    _yaml_representers.append((data_type, representer))
+
+def _register_yaml_representers(dumper):
+    for data_type, representer in _yaml_representers:
+        dumper.add_representer(data_type, representer)
+
+_yaml_plain_regex = re.compile("^[A-Za-z_/][A-Za-z0-9_./+-]*$")
+_yaml_implicit_words = set([
+    "yes", "Yes", "YES", "no", "No", "NO",
+    "true", "True", "TRUE", "false", "False", "FALSE",
+    "on", "On", "ON", "off", "Off", "OFF",
+    "null", "Null", "NULL"
+])
+
+def _is_yaml_plain_string(string):
+    if _yaml_plain_regex.match(string) == None or string[-1] in "./":
+        return False
+    else:
+        return string not in _yaml_implicit_words
+
 class _RuleCommand(str):
     pass
 
 def _rule_command_representer(dumper, value):
-    return dumper.represent_scalar(u"tag:yaml.org,2002:str", value, "|")
+    return dumper.represent_scalar(u"tag:yaml.org,2002:str", str(value), "|")
 
-yaml.add_representer(_RuleCommand, _rule_command_representer)
+_add_yaml_representer(_RuleCommand, _rule_command_representer)
 
 class Target:
     def __init__(self, data, default_package_path = "package", default_target_name = "build"):
@@ -66,7 +129,11 @@ class Target:
             self.name = str(data)
      
     def __str__(self):
-         return _string_without_newline(yaml.dump(self, default_flow_style = False))
+        if _is_yaml_plain_string(self.package_path) and _is_yaml_plain_string(self.name):
+            return "[" + self.package_path + ", " + self.name + "]"
+        else:
+            _import_yaml()
+            return _string_without_newline(_yaml.dump(self, Dumper = _YamlDumper, default_flow_style = False))
 
     def __eq__(self, target):
         if isinstance(target, Target):
@@ -111,7 +178,7 @@ class Target:
 def _target_representer(dumper, value):
     return dumper.represent_sequence(u"tag:yaml.org,2002:seq", [value.package_path, value.name], "[")
 
-yaml.add_representer(Target, _target_representer)
+_add_yaml_representer(Target, _target_representer)
 
 def make_target(package_path, target_name):
     return Target([package_path, target_name], package_path)
@@ -141,23 +208,66 @@ class Rule:
                 self.cmd = str(data["cmd"])
             else:
                 self.cmd = ""
+            if "outputs" in data:
+                if isinstance(data["outputs"], list):
+                    self.outputs = map(str, data["outputs"])
+                else:
+                    self.outputs = [str(data["outputs"])]
+            else:
+                self.outputs = []
+            if "inputs" in data:
+                if isinstance(data["inputs"], list):
+                    self.inputs = map(str, data["inputs"])
+                else:
+                    self.inputs = [str(data["inputs"])]
+            else:
+                self.inputs = []
+            self.cpu = _rule_weight(data, "cpu", default_package_path, default_target_name)
+            self.mem = _rule_weight(data, "mem", default_package_path, default_target_name)
         else:
             self.phony = False
             self.reqs = []
             self.unmake = False
+            self.outputs = []
+            self.inputs = []
+            self.cpu = 0
+            self.mem = 0
             if data !=  None:
                 self.cmd = str(data)
             else:
                 self.cmd = ""
 
     def __str__(self):
-        return _string_without_newline(yaml.dump(self, default_flow_style = False))
+        _import_yaml()
+        return _string_without_newline(_yaml.dump(self, Dumper = _YamlDumper, default_flow_style = False))
+
+def _rule_weight(data, key, package_path, target_name):
+    if key not in data:
+        return 0
+    try:
+        weight = float(data[key])
+    except (TypeError, ValueError):
+        weight = -1.0
+    if not (0.0 <= weight < float("inf")):
+        raise PackageException(package_path, "incorrect " + key + " of rule " + target_name)
+    if weight == int(weight):
+        return int(weight)
+    else:
+        return weight
 
 def _rule_representer(dumper, value):
     pairs = [("phony", value.phony), ("reqs", value.reqs), ("unmake", value.unmake), ("cmd", _RuleCommand(value.cmd))]
+    if value.outputs != []:
+        pairs.append(("outputs", value.outputs))
+    if value.inputs != []:
+        pairs.append(("inputs", value.inputs))
+    if value.cpu != 0:
+        pairs.append(("cpu", value.cpu))
+    if value.mem != 0:
+        pairs.append(("mem", value.mem))
     return dumper.represent_mapping(u"tag:yaml.org,2002:map", pairs)
 
-yaml.add_representer(Rule, _rule_representer)
+_add_yaml_representer(Rule, _rule_representer)
 
 class Package:
     def __init__(self, path, collection, required_var_names):
@@ -180,43 +290,334 @@ class Package:
             self.rules = { "build": Rule(str(rule_dict_data), path, "build") }
 
     def __str__(self):
-        return _string_without_newline(yaml.dump(self, default_flow_style = False))
+        _import_yaml()
+        return _string_without_newline(_yaml.dump(self, Dumper = _YamlDumper, default_flow_style = False))
 
 def _package_representer(dumper, value):
     pairs = [("info", value.info), ("rules", value.rules)]
     return dumper.represent_mapping(u"tag:yaml.org,2002:map", pairs)
 
-yaml.add_representer(Package, _package_representer)
+_add_yaml_representer(Package, _package_representer)
+
+def _is_yaml_plain_item(item):
+    if isinstance(item, Target):
+        return _is_yaml_plain_string(item.package_path) and _is_yaml_plain_string(item.name)
+    else:
+        return isinstance(item, str) and _is_yaml_plain_string(item)
+
+def dump_yaml(data):
+    if isinstance(data, list) and data != [] and all(map(_is_yaml_plain_item, data)):
+        return "".join(map(lambda item: "- " + str(item) + "\n", data))
+    _import_yaml()
+    return _yaml.dump(data, Dumper = _YamlDumper, default_flow_style = False, default_style = "")
+
+def _json_default(value):
+    if isinstance(value, Target):
+        return [value.package_path, value.name]
+    elif isinstance(value, Rule):
+        data = { "phony": value.phony, "reqs": value.reqs, "unmake": value.unmake, "cmd": value.cmd }
+        if value.outputs != []:
+            data["outputs"] = value.outputs
+        if value.inputs != []:
+            data["inputs"] = value.inputs
+        if value.cpu != 0:
+            data["cpu"] = value.cpu
+        if value.mem != 0:
+            data["mem"] = value.mem
+        return data
+    elif isinstance(value, Package):
+        return { "info": value.info, "rules": value.rules }
+    elif hasattr(value, "isoformat"):
+        return value.isoformat()
+    elif isinstance(value, (set, frozenset)):
+        return sorted(value)
+    else:
+        return str(value)
+
+def dump_json(data):
+    return json.dumps(data, default = _json_default, sort_keys = True)
+
+_PACKAGE_CACHE_VERSION = 5
+
+def _file_fingerprint(file):
+    try:
+        file_stat = stat(file)
+        return (file_stat.st_mtime, file_stat.st_size)
+    except OSError as e:
+        if e.errno == ENOENT:
+            return None
+        else:
+            raise
+
+def _wait_for_process(popen):
+    if not hasattr(os, "wait4"):
+        return (popen.wait(), 0.0)
+    while True:
+        try:
+            pid, wait_status, rusage = os.wait4(popen.pid, 0)
+            break
+        except OSError as e:
+            if e.errno != EINTR:
+                raise
+    if os.WIFSIGNALED(wait_status):
+        popen.returncode = -os.WTERMSIG(wait_status)
+    else:
+        popen.returncode = os.WEXITSTATUS(wait_status)
+    return (popen.returncode, rusage.ru_utime + rusage.ru_stime)
+
+_max_rss_measuring_code = """
+from errno import EINTR
+import os
+import resource
+import signal
+import sys
+fd = int(sys.argv[1])
+pid = os.fork()
+if pid == 0:
+    os.close(fd)
+    os.execvp("sh", ["sh"])
+signal.signal(signal.SIGINT, signal.SIG_IGN)
+while True:
+    try:
+        status = os.waitpid(pid, 0)[1]
+        break
+    except OSError as e:
+        if e.errno != EINTR:
+            raise
+os.write(fd, str(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss))
+if os.WIFSIGNALED(status):
+    signal.signal(os.WTERMSIG(status), signal.SIG_DFL)
+    os.kill(os.getpid(), os.WTERMSIG(status))
+sys.exit(os.WEXITSTATUS(status))
+"""
+
+_popen_lock = threading.Lock()
+
+def _set_close_on_exec(fd, is_close_on_exec):
+    import fcntl
+    flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+    if is_close_on_exec:
+        flags |= fcntl.FD_CLOEXEC
+    else:
+        flags &= ~fcntl.FD_CLOEXEC
+    fcntl.fcntl(fd, fcntl.F_SETFD, flags)
+
+def _read_max_rss(fd):
+    import fcntl
+    fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+    try:
+        string = os.read(fd, 64)
+    except OSError as e:
+        if e.errno == EAGAIN:
+            return None
+        raise
+    try:
+        max_rss = int(string)
+    except ValueError:
+        return None
+    if platform.system() == "Darwin":
+        max_rss //= 1024
+    return max_rss
+
+def _read_command_output(stream, fun):
+    is_broken = False
+    try:
+        while True:
+            try:
+                data = os.read(stream.fileno(), 65536)
+            except OSError as e:
+                if e.errno == EINTR:
+                    continue
+                raise
+            if data == "":
+                break
+            if not is_broken:
+                try:
+                    fun(data)
+                except (IOError, OSError):
+                    is_broken = True
+    finally:
+        stream.close()
+
+_worker_package_collection = None
+
+def _init_package_worker(kwargs):
+    global _worker_package_collection
+    _worker_package_collection = PackageCollection(**kwargs)
+
+def _load_package_in_worker(path):
+    try:
+        package = _worker_package_collection.get_package(path)
+    except EspactException:
+        return (None, None)
+    return (package, _worker_package_collection._package_dependency_files.get(path))
 
 class PackageCollection:
-    def __init__(self, dir = ".", work_dir = "work", vars = {}, filters = {}):
+    def __init__(self, dir = ".", work_dir = "work", vars = {}, filters = {}, can_use_package_cache = False, can_use_bytecode_cache = False, store_name = None, profiler = None):
         self.dir = realpath(dir)
         self.work_dir = realpath(work_dir)
         self.vars = vars
-        loader = jinja2.PrefixLoader({
-                "packages": jinja2.FileSystemLoader(join(self.dir, "packages")),
-                "templates": jinja2.FileSystemLoader(join(self.dir, "templates"))
-            })
-        self._env = jinja2.Environment(loader = loader)
-        self._env.globals.update(vars)
-        self._env.globals["package_collection_dir"] = self.dir.replace(sep, "/")
-        self._env.globals["work_dir"] = self.work_dir.replace(sep, "/")
-        self._env.globals["vars"] = vars
-        self._env.globals.update(default_variables)
-        self._env.globals.update(default_functions)
-        self._env.filters.update(default_filters)
-        self._env.filters.update(filters)
+        self.filters = filters
+        self.can_use_package_cache = can_use_package_cache
+        self.can_use_bytecode_cache = can_use_bytecode_cache
+        self.store = made_target_store(store_name, self.work_dir)
+        self.history = CommandHistory(self.work_dir)
+        self.signatures = SignatureStore(self.work_dir)
+        self.forced_targets = SignatureStore(self.work_dir, name = "forced_targets")
+        self.template_fingerprints = SignatureStore(self.work_dir, name = "template_fingerprints")
+        self.package_index = package_index(join(self.dir, "packages"), join(self.work_dir, "cache", "package_index"))
+        if profiler != None:
+            self.profiler = profiler
+        else:
+            self.profiler = NullProfiler()
+        self._env = None
+        self._loader = None
+        self._env_lock = threading.Lock()
         self._package_path_cache = None
         self._package_cache = {}
+        self._package_events = {}
+        self._package_lock = threading.Lock()
+        self._prefetch_thread = None
+        self._is_prefetching = False
+        self.can_watch_files = False
+        self.command_output_fun = None
+        self.environ = None
+        self.can_log_commands = False
+        self.can_compress_logs = False
+        self.max_log_size = None
+        self.log_tail_size = 16384
+        self.can_measure_memory = False
+        self._package_fingerprints = {}
+        self._package_dependency_files = {}
+        self._package_template_fingerprints = {}
+        self._function_template_fingerprints = None
+        self._file_hashes = {}
         self._made_target_time_cache = {}
+        self._are_made_target_times_loaded = False
+
+    def _get_env(self):
+        if self._env != None:
+            return self._env
+        self._env_lock.acquire()
+        try:
+            if self._env == None:
+                self._env = self._create_env()
+            return self._env
+        finally:
+            self._env_lock.release()
+
+    def _create_env(self):
+        from espact.loader import TemplateLoader
+        _import_jinja2()
+        _import_yaml()
+        self._loader = TemplateLoader(_jinja2.PrefixLoader({
+                "packages": _jinja2.FileSystemLoader(join(self.dir, "packages")),
+                "templates": _jinja2.FileSystemLoader(join(self.dir, "templates"))
+            }))
+        if self.can_use_bytecode_cache:
+            bytecode_cache_dir = join(self.work_dir, "cache", "bytecode")
+            try:
+                makedirs(bytecode_cache_dir)
+            except OSError as e:
+                if e.errno != EEXIST:
+                    raise PackageException(".", "OS error: " + str(e))
+            bytecode_cache = _jinja2.FileSystemBytecodeCache(bytecode_cache_dir)
+            set_bytecode_cache(bytecode_cache)
+        else:
+            bytecode_cache = None
+        env = _jinja2.Environment(loader = self._loader, bytecode_cache = bytecode_cache)
+        env.globals.update(self.vars)
+        env.globals["package_collection_dir"] = self.dir.replace(sep, "/")
+        env.globals["work_dir"] = self.work_dir.replace(sep, "/")
+        env.globals["vars"] = self.vars
+        env.globals.update(default_variables)
+        env.globals.update(default_functions)
+        env.filters.update(default_filters)
+        env.filters.update(self.filters)
+        return env
 
     def get_package(self, path):
         if path in self._package_cache:
             return self._package_cache[path]
-        else:
+        while True:
+            self._package_lock.acquire()
+            try:
+                if path in self._package_cache:
+                    return self._package_cache[path]
+                event = self._package_events.get(path)
+                if event == None:
+                    self._package_events[path] = threading.Event()
+            finally:
+                self._package_lock.release()
+            if event == None:
+                break
+            event.wait()
+        package = None
+        try:
             package = self.load_package(path)
-            self._package_cache[path] = package
-            return package
+        finally:
+            self._package_lock.acquire()
+            try:
+                if package != None:
+                    self._package_cache[path] = package
+                self._package_events.pop(path).set()
+            finally:
+                self._package_lock.release()
+        return package
+
+    def prefetch_packages(self, paths):
+        self.stop_prefetching_packages()
+        self._is_prefetching = True
+        self._prefetch_thread = threading.Thread(target = self._prefetch_packages, args = (list(paths),))
+        self._prefetch_thread.daemon = True
+        self._prefetch_thread.start()
+
+    def stop_prefetching_packages(self):
+        self._is_prefetching = False
+        if self._prefetch_thread != None:
+            self._prefetch_thread.join()
+            self._prefetch_thread = None
+
+    def load_packages_in_pool(self, paths, process_count):
+        paths = list(paths)
+        kwargs = {
+            "dir": self.dir,
+            "work_dir": self.work_dir,
+            "vars": self.vars,
+            "filters": self.filters,
+            "can_use_package_cache": self.can_use_package_cache,
+            "can_use_bytecode_cache": self.can_use_bytecode_cache
+        }
+        import multiprocessing
+        pool = multiprocessing.Pool(process_count, _init_package_worker, (kwargs,))
+        try:
+            for path, (package, files) in izip(paths, pool.imap(_load_package_in_worker, paths)):
+                if package != None and path not in self._package_cache:
+                    self._package_lock.acquire()
+                    try:
+                        self._package_cache[path] = package
+                        if files != None:
+                            self._package_dependency_files[path] = files
+                            if self.can_watch_files:
+                                self._package_fingerprints[path] = self._get_package_fingerprints(path)
+                        else:
+                            self._package_template_fingerprints[path] = None
+                    finally:
+                        self._package_lock.release()
+                yield path
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def _prefetch_packages(self, paths):
+        for path in paths:
+            if not self._is_prefetching:
+                break
+            try:
+                self.get_package(path)
+            except Exception:
+                pass
 
     def has_package(self, path):
         if self._package_path_cache != None:
@@ -226,10 +627,159 @@ class PackageCollection:
             return isfile(join(package_tree_dir, path.replace("/", sep)) + ".info.yml")
 
     def load_package(self, path):
-        return Package(path, self, self._env.globals.keys() + self._env.filters.keys() + ["__builtins__"])
+        span = self.profiler.begin(path, "package")
+        try:
+            if self.can_use_package_cache:
+                package = self.load_cached_package(path)
+                if package != None:
+                    if self.can_watch_files:
+                        self._package_fingerprints[path] = self._get_package_fingerprints(path)
+                    return package
+            directory_read_count = _directory_read_count()
+            env = self._get_env()
+            package = Package(path, self, env.globals.keys() + env.filters.keys() + ["__builtins__"])
+            if directory_read_count == _directory_read_count():
+                files = self.get_package_dependency_files(path)
+                if files != None:
+                    self._package_dependency_files[path] = files
+                if self.can_use_package_cache:
+                    self.save_cached_package(path, package)
+            else:
+                self._package_template_fingerprints[path] = None
+            if self.can_watch_files:
+                if directory_read_count == _directory_read_count():
+                    self._package_fingerprints[path] = self._get_package_fingerprints(path)
+                else:
+                    self._package_fingerprints[path] = None
+            return package
+        finally:
+            self.profiler.end(span)
 
-    def clear_package_cache():
+    def clear_package_cache(self):
         self._package_cache = {}
+        self._package_fingerprints = {}
+        self._package_dependency_files = {}
+
+    def refresh(self):
+        self.clear_package_path_cache()
+        self._package_lock.acquire()
+        try:
+            for path in self._package_cache.keys():
+                fingerprints = self._package_fingerprints.get(path)
+                is_changed = (fingerprints == None)
+                if not is_changed:
+                    try:
+                        for file, fingerprint in fingerprints:
+                            if _file_fingerprint(file) != fingerprint:
+                                is_changed = True
+                                break
+                    except OSError:
+                        is_changed = True
+                if is_changed:
+                    del self._package_cache[path]
+                    self._package_fingerprints.pop(path, None)
+                    self._package_dependency_files.pop(path, None)
+        finally:
+            self._package_lock.release()
+        self._package_template_fingerprints = {}
+        self._function_template_fingerprints = None
+        self._file_hashes = {}
+        self.clear_made_target_time_cache()
+        self.history.clear_cache()
+        self.signatures.clear_cache()
+        self.forced_targets.clear_cache()
+        self.template_fingerprints.clear_cache()
+
+    def _get_package_fingerprints(self, path):
+        files = self._package_dependency_files.get(path)
+        if files == None:
+            files = self.get_package_dependency_files(path)
+        if files == None:
+            return None
+        try:
+            return map(lambda file: (file, _file_fingerprint(file)), files)
+        except OSError:
+            return None
+
+    def _get_function_template_fingerprints(self):
+        if self._function_template_fingerprints == None:
+            self._function_template_fingerprints = map(lambda file: (file, _file_fingerprint(file)), function_template_files())
+        return self._function_template_fingerprints
+
+    def cached_package_file(self, path):
+        return join(self.work_dir, "cache", "packages", path.replace("/", sep)) + ".package"
+
+    def load_cached_package(self, path):
+        try:
+            stream = open(self.cached_package_file(path), "rb")
+            try:
+                version, dir, vars, function_template_fingerprints, file_fingerprints, package = pickle.load(stream)
+            finally:
+                stream.close()
+        except (IOError, OSError, EOFError, ValueError, TypeError, AttributeError, ImportError, pickle.UnpicklingError):
+            return None
+        if version != _PACKAGE_CACHE_VERSION or dir != self.dir or vars != self.vars:
+            return None
+        try:
+            if function_template_fingerprints != self._get_function_template_fingerprints():
+                return None
+        except OSError:
+            return None
+        try:
+            for file, fingerprint in file_fingerprints:
+                if _file_fingerprint(file) != fingerprint:
+                    return None
+        except OSError:
+            return None
+        self._package_dependency_files[path] = map(lambda pair: pair[0], file_fingerprints)
+        return package
+
+    def save_cached_package(self, path, package):
+        files = self._package_dependency_files.get(path)
+        if files == None:
+            files = self.get_package_dependency_files(path)
+        if files == None:
+            return
+        cached_package_file = self.cached_package_file(path)
+        tmp_file = cached_package_file + ".tmp"
+        try:
+            function_template_fingerprints = self._get_function_template_fingerprints()
+            file_fingerprints = map(lambda file: (file, _file_fingerprint(file)), files)
+            try:
+                makedirs(dirname(cached_package_file))
+            except OSError as e:
+                if e.errno != EEXIST:
+                    raise
+            stream = open(tmp_file, "wb")
+            try:
+                pickle.dump((_PACKAGE_CACHE_VERSION, self.dir, self.vars, function_template_fingerprints, file_fingerprints, package), stream, pickle.HIGHEST_PROTOCOL)
+            finally:
+                stream.close()
+            rename(tmp_file, cached_package_file)
+        except (IOError, OSError, pickle.PicklingError):
+            pass
+
+    def get_package_dependency_files(self, path):
+        env = self._get_env()
+        info_name = "packages/" + path + ".info.yml"
+        rule_dict_name = "packages/" + path + ".rules.yml"
+        files = [join(self.dir, "packages", path.replace("/", sep)) + ".rules.yml"]
+        if rule_dict_name in self._loader.template_files:
+            names = [info_name, rule_dict_name]
+        else:
+            names = [info_name, "templates/default.rules.yml"]
+        visited_names = set([])
+        while names != []:
+            name = names.pop()
+            if name in visited_names:
+                continue
+            visited_names.add(name)
+            if name == None or name not in self._loader.template_files:
+                return None
+            if self._loader.template_files[name] not in files:
+                files.append(self._loader.template_files[name])
+            names += self._loader.referenced_template_names(env, name)
+        return files
 
     def get_package_paths(self):
         if self._package_path_cache != None:
@@ -240,162 +790,359 @@ class PackageCollection:
             return package_paths
 
     def load_package_paths(self):
-        package_tree_dir = join(self.dir, "packages")
-        package_paths = set([])
-        for dir, dirs, files in  walk(package_tree_dir):
-            for file in files:
-                tmp_file = join(dir, file)
-                if tmp_file.endswith(".info.yml"):
-                    if isfile(tmp_file):
-                        if tmp_file.startswith(package_tree_dir):
-                            tmp_path = tmp_file[len(package_tree_dir):-9]
-                            if len(tmp_path) >= 1:
-                                if tmp_path[0] == sep:
-                                    tmp_path = tmp_path[1:]
-                            package_paths.add(tmp_path.replace(sep, "/"))
-        return package_paths
+        span = self.profiler.begin("load_package_paths", "package_paths")
+        try:
+            return self.package_index.package_paths()
+        finally:
+            self.profiler.end(span)
 
     def clear_package_path_cache(self):
         self._package_path_cache = None
+        self.package_index.invalidate()
+
+    def compile_templates(self):
+        env = self._get_env()
+        exceptions = []
+        for name, e in compile_function_templates():
+            exceptions.append(exception_to_template_compilation_exception(e, "espact/templates/" + name))
+        for name in sorted(env.list_templates()):
+            if name.startswith("packages/") and not (name.endswith(".info.yml") or name.endswith(".rules.yml")):
+                continue
+            try:
+                env.get_template(name)
+            except (_jinja2.TemplateError, IOError) as e:
+                exceptions.append(exception_to_template_compilation_exception(e, name))
+        return exceptions
 
     def load_package_info_data(self, path):
         try:
             return self._load_yaml_template_file("packages/" + path + ".info.yml")
-        except jinja2.TemplateNotFound:
+        except _jinja2.TemplateNotFound:
             raise NoPackageException(path)
-        except (jinja2.TemplateError, yaml.YAMLError, IOError) as e:
+        except (_jinja2.TemplateError, _yaml.YAMLError, IOError) as e:
             raise exception_to_package_exception(e, path)
 
     def load_package_rule_dict_data(self, path, *args, **kwargs):
         try:
             try:
                 return self._load_yaml_template_file("packages/" + path + ".rules.yml", *args, **kwargs)
-            except jinja2.TemplateNotFound:
+            except _jinja2.TemplateNotFound:
                 return self._load_yaml_template_string("{% extends \"templates/default.rules.yml\" %}", *args, **kwargs)
-        except (jinja2.TemplateError, yaml.YAMLError, IOError) as e:
+        except (_jinja2.TemplateError, _yaml.YAMLError, IOError) as e:
             raise exception_to_package_exception(e, path)
 
-    def execute_rule_command(self, target):
+    def execute_rule_command(self, target, env = None):
+        span = self.profiler.begin(str(target), "command")
+        try:
+            return self._execute_rule_command(target, env)
+        finally:
+            self.profiler.end(span)
+
+    def command_log_file(self, target):
+        file = join(self.work_dir, "logs", target.package_path.replace("/", sep), target.name) + ".log"
+        if self.can_compress_logs:
+            file += ".gz"
+        return file
+
+    def _execute_rule_command(self, target, env):
+        import subprocess
         package = self.get_package(target.package_path)
         try:
             makedirs(self.work_dir)
         except OSError as e:
             if e.errno != EEXIST:
                 raise CommandErrorException(target, str(e))
+        log = None
+        max_rss_fds = None
         try:
-            popen = subprocess.Popen(["sh"], stdin = subprocess.PIPE, cwd = self.work_dir)
-            popen.communicate(package.rules[target.name].cmd)
-            return popen.wait()
-        except OSError as e:
+            try:
+                start_time = time.time()
+                if self.environ != None:
+                    new_env = dict(self.environ)
+                    if env != None:
+                        new_env.update(env)
+                elif env != None:
+                    new_env = dict(os.environ)
+                    new_env.update(env)
+                else:
+                    new_env = None
+                _popen_lock.acquire()
+                try:
+                    if self.can_log_commands:
+                        log = CommandLog(self.command_log_file(target), self.can_compress_logs, self.max_log_size, self.log_tail_size)
+                        _set_close_on_exec(log.fileno(), True)
+                        output_fun = log.write
+                    else:
+                        output_fun = self.command_output_fun
+                    if self.can_measure_memory:
+                        max_rss_fds = pipe()
+                        _set_close_on_exec(max_rss_fds[0], True)
+                        _set_close_on_exec(max_rss_fds[1], True)
+                        args = [sys.executable, "-S", "-c", _max_rss_measuring_code, str(max_rss_fds[1])]
+                        preexec_fun = lambda: _set_close_on_exec(max_rss_fds[1], False)
+                    else:
+                        args = ["sh"]
+                        preexec_fun = None
+                    if output_fun != None:
+                        popen = subprocess.Popen(args, stdin = subprocess.PIPE, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, cwd = self.work_dir, env = new_env, close_fds = False, preexec_fn = preexec_fun)
+                        _set_close_on_exec(popen.stdout.fileno(), True)
+                    else:
+                        popen = subprocess.Popen(args, stdin = subprocess.PIPE, cwd = self.work_dir, env = new_env, close_fds = False, preexec_fn = preexec_fun)
+                    _set_close_on_exec(popen.stdin.fileno(), True)
+                finally:
+                    _popen_lock.release()
+                if output_fun != None:
+                    output_thread = threading.Thread(target = _read_command_output, args = (popen.stdout, output_fun))
+                    output_thread.daemon = True
+                    output_thread.start()
+                else:
+                    output_thread = None
+                if max_rss_fds != None:
+                    os.close(max_rss_fds[1])
+                    max_rss_fds = (max_rss_fds[0], None)
+                try:
+                    popen.stdin.write(package.rules[target.name].cmd)
+                except IOError as e:
+                    if e.errno != EPIPE:
+                        raise
+                popen.stdin.close()
+                status, cpu_time = _wait_for_process(popen)
+                if output_thread != None:
+                    output_thread.join()
+                wall_time = time.time() - start_time
+                if max_rss_fds != None:
+                    max_rss = _read_max_rss(max_rss_fds[0])
+                else:
+                    max_rss = None
+            finally:
+                if log != None:
+                    log.close()
+                if max_rss_fds != None:
+                    for fd in max_rss_fds:
+                        if fd != None:
+                            os.close(fd)
+        except (IOError, OSError) as e:
             raise CommandErrorException(target, str(e))
+        if status != 0 and log != None:
+            self._write_command_log_tail(target, log)
+        self.history.add_command_record(target, CommandRecord(wall_time, cpu_time, status, max_rss))
+        return status
+
+    def _write_command_log_tail(self, target, log):
+        tail = log.tail()
+        if tail == "":
+            return
+        message = "*** Last " + str(len(tail)) + " bytes of log of target " + str(target) + " (" + log.file + "):\n" + tail
+        if not message.endswith("\n"):
+            message += "\n"
+        if self.command_output_fun != None:
+            self.command_output_fun(message)
+        else:
+            sys.stdout.write(message)
+            sys.stdout.flush()
+
+    def get_command_record(self, target):
+        return self.history.get_command_record(target)
+
+    def get_target_signature(self, target):
+        return self.signatures.get_signature(target)
+
+    def add_target_signature(self, target, signature):
+        self.signatures.add_signature(target, signature)
+
+    def has_forced_target(self, target):
+        return self.forced_targets.get_signature(target) == "forced"
+
+    def add_forced_target(self, target):
+        self.forced_targets.add_signature(target, "forced")
+
+    def remove_forced_target(self, target):
+        if self.has_forced_target(target):
+            self.forced_targets.add_signature(target, "made")
+
+    def compute_artifact_key(self, target):
+        signature = self.compute_target_signature(target)
+        if signature == None:
+            return None
+        rule = self.get_package(target.package_path).rules[target.name]
+        hash = hashlib.sha1()
+        hash.update("signature\t" + signature + "\n")
+        if rule.inputs != []:
+            digest = path_digest(self.work_dir, rule.inputs)
+            if digest == None:
+                return None
+            hash.update("inputs\t" + digest + "\n")
+        for req in rule.reqs:
+            req_outputs = self.get_package(req.package_path).rules[req.name].outputs
+            if req_outputs != []:
+                digest = path_digest(self.work_dir, req_outputs)
+                if digest == None:
+                    return None
+                hash.update("req_outputs\t" + str(req) + "\t" + digest + "\n")
+        return hash.hexdigest()
+
+    def compute_target_signature(self, target):
+        rule = self.get_package(target.package_path).rules[target.name]
+        hash = hashlib.sha1()
+        hash.update("cmd\t" + str(len(rule.cmd)) + "\t" + rule.cmd + "\n")
+        if rule.outputs != []:
+            hash.update("outputs\t" + "\t".join(rule.outputs) + "\n")
+        if isinstance(rule.unmake, list):
+            hash.update("unmake\t" + "\t".join(map(str, rule.unmake)) + "\n")
+        else:
+            hash.update("unmake\t" + str(rule.unmake) + "\n")
+        for req in rule.reqs:
+            if self.get_package(req.package_path).rules[req.name].phony:
+                return None
+            req_signature = self.get_target_signature(req)
+            if req_signature == None:
+                return None
+            hash.update("req\t" + str(req) + "\t" + req_signature + "\n")
+        return hash.hexdigest()
+
+    def get_target_template_fingerprint(self, target):
+        return self.template_fingerprints.get_signature(target)
+
+    def add_target_template_fingerprint(self, target, fingerprint):
+        self.template_fingerprints.add_signature(target, fingerprint)
+
+    def compute_package_template_fingerprint(self, path):
+        if path in self._package_template_fingerprints:
+            return self._package_template_fingerprints[path]
+        self.get_package(path)
+        files = self._package_dependency_files.get(path)
+        if files == None:
+            files = self.get_package_dependency_files(path)
+        fingerprint = None
+        if files != None:
+            hash = hashlib.sha1()
+            for file in sorted(files):
+                file_hash = self._get_file_hash(file)
+                if file_hash == None:
+                    hash = None
+                    break
+                hash.update(file + "\t" + file_hash + "\n")
+            if hash != None:
+                fingerprint = hash.hexdigest()
+        self._package_template_fingerprints[path] = fingerprint
+        return fingerprint
+
+    def _get_file_hash(self, file):
+        if file not in self._file_hashes:
+            try:
+                stream = open(file, "rb")
+                try:
+                    self._file_hashes[file] = hashlib.sha1(stream.read()).hexdigest()
+                finally:
+                    stream.close()
+            except IOError as e:
+                if e.errno == ENOENT:
+                    self._file_hashes[file] = "-"
+                else:
+                    self._file_hashes[file] = None
+        return self._file_hashes[file]
 
     def made_target_file(self, target):
-        target_tree_dir = join(self.work_dir, "targets", target.package_path.replace("/", sep)) + ".targets"
-        return join(target_tree_dir, target.name.replace("/", sep)) + ".target"
+        return MadeTargetFileStore(self.work_dir).made_target_file(target)
 
     def has_made_target(self, target):
         return self.get_made_target_time(target) != None
 
     def add_made_target(self, target, can_create_file = True, is_unmaking = False):
+        self._load_made_target_times()
         if not is_unmaking:
-            current_time = datetime.utcnow()
-            self._made_target_time_cache[target] = current_time
+            self._made_target_time_cache[target] = datetime.utcnow()
         else:
             self._made_target_time_cache[target] = "unmaking"
         if can_create_file:
-            target_file =  self.made_target_file(target)
-            try:
-                makedirs(dirname(target_file))
-            except (IOError, OSError) as e:
-                if e.errno != EEXIST:
-                    if isinstance(e, IOError):
-                        raise TargetException(target, "IO error: " + str(e))
-                    else:
-                        raise TargetException(target, "OS error: " + str(e))
-            try:
-                stream = open(target_file, "w")
-                try:
-                    if not is_unmaking:
-                        stream.write(current_time.strftime("%Y-%m-%dT%H:%M:%S.%f") + "\n")
-                    else:
-                        stream.write(self._made_target_time_cache[target] + "\n")
-                finally:
-                    stream.close()
-            except IOError as e:
-                raise TargetException(target, "IO error: " + str(e))
-            except OSError as e:
-                raise TargetException(target, "OS error: " + str(e))
-            
+            self.store.add_made_target(target, self._made_target_time_cache[target])
+
     def remove_made_target(self, target):
+        self._load_made_target_times()
         if target in self._made_target_time_cache:
             del self._made_target_time_cache[target]
+        self.store.remove_made_target(target)
+
+    def flush_made_targets(self):
+        span = self.profiler.begin("flush", "store")
         try:
-            remove(self.made_target_file(target))
-        except (IOError, OSError) as e:
-            if e.errno != ENOENT:
-                if isinstance(e, IOError):
-                    raise TargetException(target, "IO error: " + str(e))
-                else:
-                    raise TargetException(target, "OS error: " + str(e))
+            self.store.flush()
+        finally:
+            self.profiler.end(span)
 
     def get_made_target_time(self, target):
+        self._load_made_target_times()
         if target in self._made_target_time_cache:
             return self._made_target_time_cache[target]
+        elif self._are_made_target_times_loaded:
+            return None
         else:
             made_target_time = self.load_made_target_time(target)
             self._made_target_time_cache[target] = made_target_time
             return made_target_time
 
     def load_made_target_time(self, target):
-        target_file = self.made_target_file(target)
+        span = self.profiler.begin("load_made_target_time", "store")
         try:
-            stream = open(target_file, "r")
-            try:
-                line = _string_without_newline(stream.readline())
-                if line != "unmaking":
-                    time = datetime.strptime(line, "%Y-%m-%dT%H:%M:%S.%f")
-                else:
-                    return "unmaking"
-            finally:
-                stream.close()
-            return time
-        except (IOError, OSError) as e:
-            if e.errno == ENOENT:
-                return None
-            else:
-                if isinstance(e, IOError):
-                    raise TargetException(target, "IO error: " + str(e))
-                else:
-                    raise TargetException(target, "OS error: " + str(e))
-        except ValueError as e:
-            raise TargetException(target, "incorrect date: " + str(e))
+            return self.store.load_made_target_time(target)
+        finally:
+            self.profiler.end(span)
 
     def clear_made_target_time_cache(self):
         self._made_target_time_cache = {}
+        self._are_made_target_times_loaded = False
+
+    def _load_made_target_times(self):
+        if not self._are_made_target_times_loaded:
+            span = self.profiler.begin("load_made_target_times", "store")
+            try:
+                made_target_times = self.store.load_made_target_times()
+            finally:
+                self.profiler.end(span)
+            if made_target_times != None:
+                for target, made_target_time in made_target_times.items():
+                    if target not in self._made_target_time_cache:
+                        self._made_target_time_cache[target] = made_target_time
+                self._are_made_target_times_loaded = True
 
     def has_unmaking_target(self, target):
         return self.get_made_target_time(target) == "unmaking"
 
     def _load_yaml_template_file(self, file, *args, **kwargs):
-        template = self._env.get_template(file)
+        span = self.profiler.begin(file, "jinja")
         try:
-            tmp_string = template.render(*args, **kwargs)
-        except:
-            e_type, e, tb = sys.exc_info()
-            raise self._exception_info_to_exception(file, e_type, e, tb)
-        return yaml.load(tmp_string)
+            template = self._get_env().get_template(file)
+            try:
+                tmp_string = template.render(*args, **kwargs)
+            except:
+                e_type, e, tb = sys.exc_info()
+                raise self._exception_info_to_exception(file, e_type, e, tb)
+        finally:
+            self.profiler.end(span)
+        return self._load_yaml(file, tmp_string)
 
     def _load_yaml_template_string(self, string, *args, **kwargs):
-        template = self._env.from_string(string)
+        span = self.profiler.begin("<string>", "jinja")
+        try:
+            template = self._get_env().from_string(string)
+            try:
+                tmp_string = template.render(*args, **kwargs)
+            except:
+                e_type, e, tb = sys.exc_info()
+                raise self._exception_info_to_exception("<string>", e_type, e, tb)
+        finally:
+            self.profiler.end(span)
+        return self._load_yaml("<string>", tmp_string)
+
+    def _load_yaml(self, file, string):
+        span = self.profiler.begin(file, "yaml")
         try:
-            tmp_string = template.render(*args, **kwargs)
-        except:
-            e_type, e, tb = sys.exc_info()
-            raise self._exception_info_to_exception("<string>", e_type, e, tb)
-        return yaml.load(tmp_string)
+            return _yaml.load(string, Loader = _YamlLoader)
+        finally:
+            self.profiler.end(span)
 
     def _exception_info_to_exception(self, file, e_type, e, tb):
-        if not isinstance(e, jinja2.TemplateError):
+        if not isinstance(e, _jinja2.TemplateError):
             return TemplateException(file, traceback.format_exception(e_type, e, tb))
         else:
             return e
@@ -0,0 +1,119 @@
+# -*- coding: UTF-8 -*-
+# Copyright (c) 2018 Łukasz Szpakowski
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import json
+import os
+import threading
+import time
+
+__all__ = ["Profiler", "NullProfiler"]
+
+class _Span:
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start_time = time.time()
+        self.thread_id = threading.current_thread().ident
+
+class Profiler:
+    def __init__(self):
+        self.spans = []
+        self.start_time = time.time()
+        self._lock = threading.Lock()
+
+    def begin(self, name, category, args = {}):
+        return _Span(name, category, args)
+
+    def end(self, span):
+        span.end_time = time.time()
+        self._lock.acquire()
+        try:
+            self.spans.append(span)
+        finally:
+            self._lock.release()
+
+    def trace_events(self):
+        pid = os.getpid()
+        events = []
+        for span in sorted(self.spans, key = lambda span: span.start_time):
+            events.append({
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": int((span.start_time - self.start_time) * 1000000),
+                "dur": int((span.end_time - span.start_time) * 1000000),
+                "pid": pid,
+                "tid": span.thread_id,
+                "args": span.args
+            })
+        return events
+
+    def write_trace(self, file):
+        stream = open(file, "w")
+        try:
+            json.dump({ "traceEvents": self.trace_events(), "displayTimeUnit": "ms" }, stream)
+        finally:
+            stream.close()
+
+    def _self_times(self):
+        self_times = {}
+        thread_spans = {}
+        for span in self.spans:
+            self_times[span] = span.end_time - span.start_time
+            thread_spans.setdefault(span.thread_id, []).append(span)
+        for spans in thread_spans.values():
+            stack = []
+            for span in sorted(spans, key = lambda span: (span.start_time, -span.end_time)):
+                while stack != [] and stack[-1].end_time < span.end_time:
+                    stack.pop()
+                if stack != []:
+                    self_times[stack[-1]] -= span.end_time - span.start_time
+                stack.append(span)
+        return self_times
+
+    def summary(self, count = 10):
+        categories = {}
+        names = {}
+        self_times = self._self_times()
+        for span in self.spans:
+            duration = self_times[span]
+            total_time, span_count = categories.get(span.category, (0.0, 0))
+            categories[span.category] = (total_time + duration, span_count + 1)
+            total_time, span_count = names.get((span.category, span.name), (0.0, 0))
+            names[(span.category, span.name)] = (total_time + duration, span_count + 1)
+        lines = ["total: %.3f s" % (time.time() - self.start_time)]
+        for category in sorted(categories.keys(), key = lambda category: -categories[category][0]):
+            total_time, span_count = categories[category]
+            lines.append("%s: %.3f s (%d)" % (category, total_time, span_count))
+            category_names = filter(lambda pair: pair[0] == category, names.keys())
+            for pair in sorted(category_names, key = lambda pair: -names[pair][0])[0:count]:
+                total_time, span_count = names[pair]
+                lines.append("  %s: %.3f s (%d)" % (pair[1], total_time, span_count))
+        return lines
+
+class NullProfiler:
+    def begin(self, name, category, args = {}):
+        return None
+
+    def end(self, span):
+        pass
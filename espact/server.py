@@ -0,0 +1,226 @@
+# -*- coding: UTF-8 -*-
+# Copyright (c) 2018 Łukasz Szpakowski
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+from errno import ECONNREFUSED, EINTR, ENOENT
+import json
+from os import makedirs, remove
+from os.path import dirname, exists, join
+import socket
+import struct
+import threading
+from espact.exceptions import ServerException
+
+__all__ = ["Server", "request_server", "server_socket_file"]
+
+_FRAME_HEADER_SIZE = 5
+
+def server_socket_file(work_dir):
+    return join(work_dir, "espact.sock")
+
+def _set_close_on_exec(sock):
+    import fcntl
+    fcntl.fcntl(sock.fileno(), fcntl.F_SETFD, fcntl.fcntl(sock.fileno(), fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+
+def _write_frame(sock, kind, data):
+    sock.sendall(kind + struct.pack(">I", len(data)) + data)
+
+def _read_bytes(sock, size):
+    chunks = []
+    while size > 0:
+        try:
+            chunk = sock.recv(min(size, 65536))
+        except socket.error as e:
+            if e.errno == EINTR:
+                continue
+            raise
+        if chunk == "":
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return "".join(chunks)
+
+def _read_frame(sock):
+    header = _read_bytes(sock, _FRAME_HEADER_SIZE)
+    if header == None:
+        return None
+    kind = header[0]
+    size = struct.unpack(">I", header[1:])[0]
+    data = _read_bytes(sock, size)
+    if data == None:
+        return None
+    return (kind, data)
+
+class FrameStream:
+    def __init__(self, sock, kind, lock):
+        self.sock = sock
+        self.kind = kind
+        self._lock = lock
+        self.is_broken = False
+
+    def write(self, string):
+        if isinstance(string, unicode):
+            string = string.encode("UTF-8")
+        self._lock.acquire()
+        try:
+            if not self.is_broken and string != "":
+                try:
+                    _write_frame(self.sock, self.kind, string)
+                except socket.error:
+                    self.is_broken = True
+        finally:
+            self._lock.release()
+
+    def flush(self):
+        pass
+
+class Server:
+    def __init__(self, file, request_fun):
+        self.file = file
+        self.request_fun = request_fun
+        self._sock = None
+
+    def listen(self):
+        if exists(self.file):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                try:
+                    sock.connect(self.file)
+                    raise ServerException(self.file, "server is already running")
+                except socket.error as e:
+                    if e.errno not in [ECONNREFUSED, ENOENT]:
+                        raise ServerException(self.file, "socket error: " + str(e))
+            finally:
+                sock.close()
+            try:
+                remove(self.file)
+            except OSError as e:
+                if e.errno != ENOENT:
+                    raise ServerException(self.file, "OS error: " + str(e))
+        try:
+            makedirs(dirname(self.file))
+        except OSError:
+            pass
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        _set_close_on_exec(self._sock)
+        try:
+            self._sock.bind(self.file)
+            self._sock.listen(16)
+        except socket.error as e:
+            self._sock.close()
+            self._sock = None
+            raise ServerException(self.file, "socket error: " + str(e))
+
+    def serve(self):
+        while True:
+            try:
+                conn = self._sock.accept()[0]
+            except socket.error as e:
+                if e.errno == EINTR:
+                    continue
+                raise ServerException(self.file, "socket error: " + str(e))
+            try:
+                _set_close_on_exec(conn)
+                thread = threading.Thread(target = self._serve_connection, args = (conn,))
+                thread.daemon = True
+                thread.start()
+            except:
+                conn.close()
+                raise
+
+    def _serve_connection(self, conn):
+        try:
+            self._serve_request(conn)
+        finally:
+            conn.close()
+
+    def close(self):
+        if self._sock != None:
+            self._sock.close()
+            self._sock = None
+            try:
+                remove(self.file)
+            except OSError:
+                pass
+
+    def _serve_request(self, conn):
+        try:
+            frame = _read_frame(conn)
+        except socket.error:
+            return
+        if frame == None or frame[0] != "r":
+            return
+        lock = threading.Lock()
+        stdout = FrameStream(conn, "o", lock)
+        stderr = FrameStream(conn, "e", lock)
+        try:
+            request = json.loads(frame[1])
+            argv = map(lambda arg: arg.encode("UTF-8"), request["argv"])
+            cwd = request["cwd"].encode("UTF-8")
+            environ = dict(map(lambda pair: (pair[0].encode("UTF-8"), pair[1].encode("UTF-8")), request["env"].items()))
+            status = self.request_fun(argv, cwd, environ, stdout, stderr)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            stderr.write("error: incorrect request\n")
+            status = 1
+        except OSError as e:
+            stderr.write("error: " + str(e) + "\n")
+            status = 1
+        except Exception as e:
+            stderr.write("error: " + str(e) + "\n")
+            status = 1
+        if status == None:
+            status = 0
+        elif not isinstance(status, int):
+            stderr.write(str(status) + "\n")
+            status = 1
+        lock.acquire()
+        try:
+            _write_frame(conn, "s", str(status))
+        except socket.error:
+            pass
+        finally:
+            lock.release()
+
+def request_server(file, argv, cwd, environ, stdout, stderr):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(file)
+            _write_frame(sock, "r", json.dumps({ "argv": argv, "cwd": cwd, "env": dict(environ) }))
+            while True:
+                frame = _read_frame(sock)
+                if frame == None:
+                    raise ServerException(file, "connection was closed")
+                kind, data = frame
+                if kind == "o":
+                    stdout.write(data)
+                    stdout.flush()
+                elif kind == "e":
+                    stderr.write(data)
+                    stderr.flush()
+                elif kind == "s":
+                    return int(data)
+        except socket.error as e:
+            raise ServerException(file, "socket error: " + str(e))
+        except ValueError:
+            raise ServerException(file, "incorrect status")
+    finally:
+        sock.close()
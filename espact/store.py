@@ -0,0 +1,449 @@
+# -*- coding: UTF-8 -*-
+# Copyright (c) 2018 Łukasz Szpakowski
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+from datetime import datetime
+from errno import EEXIST, ENOENT
+from os.path import dirname, isdir, isfile, join
+from os import fstat, makedirs, remove, rename, sep, stat, walk
+import threading
+import time as time_module
+from espact.exceptions import StoreException, TargetException
+
+__all__ = ["MadeTargetFileStore", "MadeTargetJournalStore", "SignatureStore", "made_target_store"]
+
+_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+def _string_without_newline(string):
+    if string != "" and string[-1] == "\n":
+        return string[0:-1]
+    else:
+        return string
+
+def made_target_time_to_string(time):
+    if time != "unmaking":
+        return time.strftime(_TIME_FORMAT)
+    else:
+        return "unmaking"
+
+def string_to_made_target_time(string):
+    if string == "unmaking":
+        return "unmaking"
+    elif len(string) == 26 and string[4] == "-" and string[7] == "-" and string[10] == "T" and string[13] == ":" and string[16] == ":" and string[19] == ".":
+        return datetime(int(string[0:4]), int(string[5:7]), int(string[8:10]), int(string[11:13]), int(string[14:16]), int(string[17:19]), int(string[20:26]))
+    else:
+        return datetime.strptime(string, _TIME_FORMAT)
+
+def _make_dirs(dir):
+    try:
+        makedirs(dir)
+    except OSError as e:
+        if e.errno != EEXIST:
+            raise
+
+class MadeTargetFileStore:
+    def __init__(self, work_dir):
+        self.work_dir = work_dir
+
+    def made_target_file(self, target):
+        target_tree_dir = join(self.work_dir, "targets", target.package_path.replace("/", sep)) + ".targets"
+        return join(target_tree_dir, target.name.replace("/", sep)) + ".target"
+
+    def load_made_target_time(self, target):
+        target_file = self.made_target_file(target)
+        try:
+            stream = open(target_file, "r")
+            try:
+                line = _string_without_newline(stream.readline())
+            finally:
+                stream.close()
+            return string_to_made_target_time(line)
+        except (IOError, OSError) as e:
+            if e.errno == ENOENT:
+                return None
+            else:
+                if isinstance(e, IOError):
+                    raise TargetException(target, "IO error: " + str(e))
+                else:
+                    raise TargetException(target, "OS error: " + str(e))
+        except ValueError as e:
+            raise TargetException(target, "incorrect date: " + str(e))
+
+    def load_made_target_times(self):
+        return None
+
+    def add_made_target(self, target, time):
+        target_file = self.made_target_file(target)
+        try:
+            _make_dirs(dirname(target_file))
+            stream = open(target_file, "w")
+            try:
+                stream.write(made_target_time_to_string(time) + "\n")
+            finally:
+                stream.close()
+        except IOError as e:
+            raise TargetException(target, "IO error: " + str(e))
+        except OSError as e:
+            raise TargetException(target, "OS error: " + str(e))
+
+    def remove_made_target(self, target):
+        try:
+            remove(self.made_target_file(target))
+        except (IOError, OSError) as e:
+            if e.errno != ENOENT:
+                if isinstance(e, IOError):
+                    raise TargetException(target, "IO error: " + str(e))
+                else:
+                    raise TargetException(target, "OS error: " + str(e))
+
+    def load_all_made_target_times(self):
+        from espact.package import make_target
+        target_tree_dir = join(self.work_dir, "targets")
+        times = {}
+        for dir, dirs, files in walk(target_tree_dir):
+            for file in files:
+                if not file.endswith(".target"):
+                    continue
+                names = join(dir, file)[len(target_tree_dir) + 1:-7].split(sep)
+                for i in range(0, len(names) - 1):
+                    if names[i].endswith(".targets"):
+                        target = make_target("/".join(names[0:i] + [names[i][0:-8]]), "/".join(names[i + 1:]))
+                        time = self.load_made_target_time(target)
+                        if time != None:
+                            times[target] = time
+                        break
+        return times
+
+    def flush(self):
+        pass
+
+class MadeTargetJournalStore:
+    def __init__(self, work_dir, batch_size = 64, flush_interval = 1.0):
+        self.work_dir = work_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.file = join(work_dir, "targets.journal")
+        self._lines = []
+        self._flush_time = time_module.time()
+
+    def load_made_target_time(self, target):
+        return self.load_made_target_times().get(target)
+
+    def load_made_target_times(self):
+        import fcntl
+        try:
+            stream = self._open_locked_file("r", fcntl.LOCK_SH)
+        except (IOError, OSError) as e:
+            if e.errno == ENOENT:
+                if isdir(join(self.work_dir, "targets")):
+                    return self.migrate(MadeTargetFileStore(self.work_dir))
+                else:
+                    return {}
+            else:
+                raise StoreException(self.file, "IO error: " + str(e))
+        try:
+            times, line_count = self._read_made_target_times(stream)
+        finally:
+            stream.close()
+        if line_count > len(times) * 2 + self.batch_size:
+            times = self._compact()
+        return times
+
+    def add_made_target(self, target, time):
+        self._add_line(made_target_time_to_string(time), target)
+
+    def remove_made_target(self, target):
+        self._add_line("-", target)
+
+    def migrate(self, store):
+        times = store.load_all_made_target_times()
+        self._write_made_target_times(times)
+        return times
+
+    def flush(self):
+        import fcntl
+        self._flush_time = time_module.time()
+        if self._lines == []:
+            return
+        try:
+            _make_dirs(self.work_dir)
+            stream = self._open_locked_file("a", fcntl.LOCK_EX)
+            try:
+                stream.write("".join(self._lines))
+            finally:
+                stream.close()
+        except (IOError, OSError) as e:
+            raise StoreException(self.file, "IO error: " + str(e))
+        self._lines = []
+
+    def _add_line(self, string, target):
+        self._lines.append(string + "\t" + target.package_path + "\t" + target.name + "\n")
+        if len(self._lines) >= self.batch_size or time_module.time() - self._flush_time >= self.flush_interval:
+            self.flush()
+
+    def _open_locked_file(self, mode, operation):
+        import fcntl
+        while True:
+            stream = open(self.file, mode)
+            try:
+                fcntl.flock(stream.fileno(), operation)
+                if fstat(stream.fileno()).st_ino == stat(self.file).st_ino:
+                    return stream
+            except:
+                stream.close()
+                raise
+            stream.close()
+
+    def _read_made_target_times(self, stream):
+        from espact.package import make_target
+        times = {}
+        line_count = 0
+        try:
+            for line in stream:
+                line_count += 1
+                fields = _string_without_newline(line).split("\t")
+                if len(fields) != 3:
+                    raise StoreException(self.file, "incorrect line " + str(line_count))
+                target = make_target(fields[1], fields[2])
+                if fields[0] != "-":
+                    times[target] = string_to_made_target_time(fields[0])
+                elif target in times:
+                    del times[target]
+        except IOError as e:
+            raise StoreException(self.file, "IO error: " + str(e))
+        except ValueError as e:
+            raise StoreException(self.file, "incorrect date at line " + str(line_count) + ": " + str(e))
+        return times, line_count
+
+    def _compact(self):
+        import fcntl
+        try:
+            stream = self._open_locked_file("r", fcntl.LOCK_EX)
+        except (IOError, OSError) as e:
+            raise StoreException(self.file, "IO error: " + str(e))
+        try:
+            times, line_count = self._read_made_target_times(stream)
+            self._write_made_target_times(times)
+        finally:
+            stream.close()
+        return times
+
+    def _write_made_target_times(self, times):
+        tmp_file = self.file + ".tmp"
+        try:
+            _make_dirs(self.work_dir)
+            stream = open(tmp_file, "w")
+            try:
+                for target in sorted(times.keys()):
+                    stream.write(made_target_time_to_string(times[target]) + "\t" + target.package_path + "\t" + target.name + "\n")
+            finally:
+                stream.close()
+            rename(tmp_file, self.file)
+        except (IOError, OSError) as e:
+            raise StoreException(self.file, "IO error: " + str(e))
+
+class CommandRecord:
+    def __init__(self, wall_time, cpu_time, status, max_rss = None):
+        self.wall_time = wall_time
+        self.cpu_time = cpu_time
+        self.status = status
+        self.max_rss = max_rss
+
+class CommandHistory:
+    def __init__(self, work_dir, max_line_count = 4096):
+        self.work_dir = work_dir
+        self.max_line_count = max_line_count
+        self.file = join(work_dir, "history.journal")
+        self._records = None
+        self._lock = threading.Lock()
+
+    def clear_cache(self):
+        self._lock.acquire()
+        try:
+            self._records = None
+        finally:
+            self._lock.release()
+
+    def get_command_record(self, target):
+        self._lock.acquire()
+        try:
+            return self._load_command_records().get(target)
+        finally:
+            self._lock.release()
+
+    def add_command_record(self, target, record):
+        self._lock.acquire()
+        try:
+            self._load_command_records()[target] = record
+            try:
+                _make_dirs(self.work_dir)
+                stream = open(self.file, "a")
+                try:
+                    stream.write(self._record_to_line(target, record))
+                finally:
+                    stream.close()
+            except (IOError, OSError) as e:
+                raise StoreException(self.file, "IO error: " + str(e))
+        finally:
+            self._lock.release()
+
+    def _load_command_records(self):
+        from espact.package import make_target
+        if self._records != None:
+            return self._records
+        self._records = {}
+        try:
+            stream = open(self.file, "r")
+        except IOError as e:
+            if e.errno == ENOENT:
+                return self._records
+            else:
+                raise StoreException(self.file, "IO error: " + str(e))
+        line_count = 0
+        try:
+            try:
+                for line in stream:
+                    line_count += 1
+                    fields = _string_without_newline(line).split("\t")
+                    if len(fields) == 5:
+                        self._records[make_target(fields[3], fields[4])] = CommandRecord(float(fields[0]), float(fields[1]), int(fields[2]))
+                    elif len(fields) == 6:
+                        self._records[make_target(fields[4], fields[5])] = CommandRecord(float(fields[0]), float(fields[1]), int(fields[2]), int(fields[3]))
+                    else:
+                        raise StoreException(self.file, "incorrect line " + str(line_count))
+            finally:
+                stream.close()
+        except IOError as e:
+            raise StoreException(self.file, "IO error: " + str(e))
+        except ValueError as e:
+            raise StoreException(self.file, "incorrect number at line " + str(line_count) + ": " + str(e))
+        if line_count > len(self._records) + self.max_line_count:
+            tmp_file = self.file + ".tmp"
+            try:
+                stream = open(tmp_file, "w")
+                try:
+                    for target in sorted(self._records.keys()):
+                        stream.write(self._record_to_line(target, self._records[target]))
+                finally:
+                    stream.close()
+                rename(tmp_file, self.file)
+            except (IOError, OSError) as e:
+                raise StoreException(self.file, "IO error: " + str(e))
+        return self._records
+
+    def _record_to_line(self, target, record):
+        if record.max_rss != None:
+            return "%.6f\t%.6f\t%d\t%d\t%s\t%s\n" % (record.wall_time, record.cpu_time, record.status, record.max_rss, target.package_path, target.name)
+        else:
+            return "%.6f\t%.6f\t%d\t%s\t%s\n" % (record.wall_time, record.cpu_time, record.status, target.package_path, target.name)
+
+class SignatureStore:
+    def __init__(self, work_dir, max_line_count = 4096, name = "signatures"):
+        self.work_dir = work_dir
+        self.max_line_count = max_line_count
+        self.file = join(work_dir, name + ".journal")
+        self._signatures = None
+        self._lock = threading.Lock()
+
+    def clear_cache(self):
+        self._lock.acquire()
+        try:
+            self._signatures = None
+        finally:
+            self._lock.release()
+
+    def get_signature(self, target):
+        self._lock.acquire()
+        try:
+            return self._load_signatures().get(target)
+        finally:
+            self._lock.release()
+
+    def add_signature(self, target, signature):
+        self._lock.acquire()
+        try:
+            signatures = self._load_signatures()
+            if signatures.get(target) == signature:
+                return
+            signatures[target] = signature
+            try:
+                _make_dirs(self.work_dir)
+                stream = open(self.file, "a")
+                try:
+                    stream.write(signature + "\t" + target.package_path + "\t" + target.name + "\n")
+                finally:
+                    stream.close()
+            except (IOError, OSError) as e:
+                raise StoreException(self.file, "IO error: " + str(e))
+        finally:
+            self._lock.release()
+
+    def _load_signatures(self):
+        from espact.package import make_target
+        if self._signatures != None:
+            return self._signatures
+        self._signatures = {}
+        try:
+            stream = open(self.file, "r")
+        except IOError as e:
+            if e.errno == ENOENT:
+                return self._signatures
+            else:
+                raise StoreException(self.file, "IO error: " + str(e))
+        line_count = 0
+        try:
+            try:
+                for line in stream:
+                    line_count += 1
+                    fields = _string_without_newline(line).split("\t")
+                    if len(fields) != 3:
+                        raise StoreException(self.file, "incorrect line " + str(line_count))
+                    self._signatures[make_target(fields[1], fields[2])] = fields[0]
+            finally:
+                stream.close()
+        except IOError as e:
+            raise StoreException(self.file, "IO error: " + str(e))
+        if line_count > len(self._signatures) + self.max_line_count:
+            tmp_file = self.file + ".tmp"
+            try:
+                stream = open(tmp_file, "w")
+                try:
+                    for target in sorted(self._signatures.keys()):
+                        stream.write(self._signatures[target] + "\t" + target.package_path + "\t" + target.name + "\n")
+                finally:
+                    stream.close()
+                rename(tmp_file, self.file)
+            except (IOError, OSError) as e:
+                raise StoreException(self.file, "IO error: " + str(e))
+        return self._signatures
+
+def made_target_store(name, work_dir):
+    if name == "files":
+        return MadeTargetFileStore(work_dir)
+    elif name == "journal":
+        return MadeTargetJournalStore(work_dir)
+    elif name == None:
+        if isfile(join(work_dir, "targets.journal")):
+            return MadeTargetJournalStore(work_dir)
+        else:
+            return MadeTargetFileStore(work_dir)
+    else:
+        raise ValueError("unknown store " + name)
@@ -19,6 +19,7 @@
  # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
  # THE SOFTWARE.
 -#}
+MAKEFLAGS="${ESPACT_SAVED_MAKEFLAGS-$MAKEFLAGS}" \
 {% for name in env -%}
 {{name}}='{{env[name]|shsqe}}' \
 {% endfor -%}
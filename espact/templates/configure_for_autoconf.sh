@@ -27,7 +27,20 @@
     {%- if not build_dir -%}
     {%- set build_dir = "." -%}
     {%- endif -%}
+    {%- if config_cache_dir -%}
+    {%- set config_cache_file_name = config_cache_key(host, build, target, build_cc, toolchain_dir, cpp, cppflags, cc, cflags, ldflags, libs, cxx, cxxflags, fc, fflags, ar, arflags, ranlib, ranlibflags, yacc, yflags, lex, lflags, pkg_config, pkg_config_path, pkg_config_libdir, compiler_launcher, env) -%}
+    {%- endif -%}
+    {% if config_cache_dir -%}
+    espact_tmp_config_cache_file=
+    {% endif -%}
     ([ -x ./configure ] || '{{autoreconf_prog|shsqe}}' -i) && \
+    {% if config_cache_dir -%}
+    mkdir -p '{{config_cache_dir|shsqe}}' && \
+    espact_cc_sum="`'{{(cc or "cc")|shsqe}}' --version 2>&1 | cksum | cut -d ' ' -f 1`" && \
+    espact_config_cache_file='{{config_cache_dir|shsqe}}/{{config_cache_file_name}}-'"$espact_cc_sum.cache" && \
+    espact_tmp_config_cache_file="$espact_config_cache_file.$$.tmp" && \
+    { [ ! -f "$espact_config_cache_file" ] || cp "$espact_config_cache_file" "$espact_tmp_config_cache_file"; } && \
+    {% endif -%}
     {% if build_dir != "." -%}
     mkdir -p '{{build_dir|shsqe}}' && \
     cd '{{build_dir|shsqe}}' && \
@@ -62,7 +75,9 @@
     {% if cppflags -%}
     CPPFLAGS='{{cppflags|shsqe}}' \
     {% endif -%}
-    {% if cc -%}
+    {% if compiler_launcher -%}
+    CC='{{compiler_launcher|shsqe}} {{(cc or "cc")|shsqe}}' \
+    {% elif cc -%}
     CC='{{cc|shsqe}}' \
     {% endif -%}
     {% if cflags -%}
@@ -74,7 +89,9 @@
     {% if libs -%}
     LIBS='{{libs|shsqe}}' \
     {% endif -%}
-    {% if cxx -%}
+    {% if compiler_launcher -%}
+    CXX='{{compiler_launcher|shsqe}} {{(cxx or "c++")|shsqe}}' \
+    {% elif cxx -%}
     CXX='{{cxx|shsqe}}' \
     {% endif -%}
     {% if cxxflags -%}
@@ -146,4 +163,9 @@
     {%- for arg in args %} \
         '{{arg|shsqe}}'
     {%- endfor -%}
+    {%- if config_cache_dir %} \
+        --cache-file="$espact_tmp_config_cache_file" && \
+    mv -f "$espact_tmp_config_cache_file" "$espact_config_cache_file" || \
+    { [ -z "$espact_tmp_config_cache_file" ] || rm -f "$espact_tmp_config_cache_file"; false; }
+    {%- endif -%}
 {%- endblock -%}
@@ -33,8 +33,28 @@
     {%- if not find_root_dir and toolchain_dir -%}
     {%- set find_root_dir = toolchain_dir -%}
     {%- endif -%}
+    {%- if toolchain_cache_dir -%}
+    {%- set toolchain_file_name = config_cache_key("cmake", host, cc, cxx, fc, toolchain_dir, find_root_dir) -%}
+    {%- set toolchain_file = "\"$espact_tmp_toolchain_file\"" -%}
+    {%- else -%}
+    {%- set toolchain_file = "'" + (tmp_dir|shsqe) + "/Toolchain.cmake'" -%}
+    {%- endif -%}
     {%- if host -%}
+    {%- if toolchain_cache_dir -%}
+    mkdir -p '{{toolchain_cache_dir|shsqe}}' && \
+    {% set toolchain_file_prefix = "'" + (toolchain_cache_dir|shsqe) + "/" + toolchain_file_name -%}
+    {% if not find_root_dir -%}
+    espact_path_sum="`printf '%s' "$PATH" | cksum | cut -d ' ' -f 1`" && \
+    espact_toolchain_file={{toolchain_file_prefix}}-'"$espact_path_sum.cmake" && \
+    {% else -%}
+    espact_toolchain_file={{toolchain_file_prefix}}.cmake' && \
+    {% endif -%}
+    {% endif -%}
     (
+    {%- if toolchain_cache_dir %}
+        [ ! -f "$espact_toolchain_file" ] || exit 0
+        espact_tmp_toolchain_file="$espact_toolchain_file.$$.tmp"
+    {%- endif -%}
     {%- if not find_root_dir %}
         cc_path="`which '{{cc|shsqe}} '`"
         bin_path="`dirname "$cc_path"`"
@@ -43,7 +63,9 @@
         awk_script='{ gsub(/[\"$()@\\^]/, "\\\\&"); gsub(/\t/, "\\t"); gsub(/\r/, "\\r"); print; }'
         escaped_find_root_path="`printf '%s' "$find_root_path" | awk -v ORS="$awk_ors" "$awk_script"`"
     {%- endif %}
+    {%- if not toolchain_cache_dir %}
         mkdir -p '{{tmp_dir|shsqe}}'
+    {%- endif %}
     {%- set is_found = False -%}
     {%- for host_system_pattern, system_name in [
         ("linux(-[^-]*|)", "Linux"),
@@ -84,25 +106,28 @@
     {%- if not is_found -%}
     {%- if host_system_pattern != "" -%}
     {%- if match("^[^-]+(-[^-]*-|-)" + host_system_pattern + "$", host) %}
-        echo 'set(CMAKE_SYSTEM_NAME "{{system_name|cmqe|shsqe}}")' > '{{tmp_dir|shsqe}}/Toolchain.cmake'
+        echo 'set(CMAKE_SYSTEM_NAME "{{system_name|cmqe|shsqe}}")' > {{toolchain_file}}
         {%- set is_found = True -%}
     {%- endif -%}
     {%- else %}
-        echo -n > '{{tmp_dir|shsqe}}/Toolchain.cmake'
+        echo -n > {{toolchain_file}}
     {%- endif -%}
     {%- endif -%}
     {%- endfor %}
-        echo 'set(CMAKE_C_COMPILER "{{cc|cmqe|shsqe}}")' >> '{{tmp_dir|shsqe}}/Toolchain.cmake'
-        echo 'set(CMAKE_CXX_COMPILER "{{cxx|cmqe|shsqe}}")' >> '{{tmp_dir|shsqe}}/Toolchain.cmake'
-        echo 'set(CMAKE_Fortran_COMPILER "{{fc|cmqe|shsqe}}")' >> '{{tmp_dir|shsqe}}/Toolchain.cmake'
+        echo 'set(CMAKE_C_COMPILER "{{cc|cmqe|shsqe}}")' >> {{toolchain_file}}
+        echo 'set(CMAKE_CXX_COMPILER "{{cxx|cmqe|shsqe}}")' >> {{toolchain_file}}
+        echo 'set(CMAKE_Fortran_COMPILER "{{fc|cmqe|shsqe}}")' >> {{toolchain_file}}
     {%- if toolchain_dir %}
-        echo 'set(CMAKE_FIND_ROOT_PATH "{{find_root_dir|cmqe|shsqe}}")' >> '{{tmp_dir|shsqe}}/Toolchain.cmake'
+        echo 'set(CMAKE_FIND_ROOT_PATH "{{find_root_dir|cmqe|shsqe}}")' >> {{toolchain_file}}
     {%- else %}
-        echo 'set(CMAKE_FIND_ROOT_PATH "'"$escaped_find_root_path"'")' >> '{{tmp_dir|shsqe}}/Toolchain.cmake'
+        echo 'set(CMAKE_FIND_ROOT_PATH "'"$escaped_find_root_path"'")' >> {{toolchain_file}}
+    {%- endif %}
+        echo 'set(CMAKE_FIND_ROOT_PATH_MODE_PROGRAM NEVER)' >> {{toolchain_file}}
+        echo 'set(CMAKE_FIND_ROOT_PATH_MODE_LIBRARY ONLY)' >> {{toolchain_file}}
+        echo 'set(CMAKE_FIND_ROOT_PATH_MODE_INCLUDE ONLY)' >> {{toolchain_file}}
+    {%- if toolchain_cache_dir %}
+        mv -f "$espact_tmp_toolchain_file" "$espact_toolchain_file"
     {%- endif %}
-        echo 'set(CMAKE_FIND_ROOT_PATH_MODE_PROGRAM NEVER)' >> '{{tmp_dir|shsqe}}/Toolchain.cmake'
-        echo 'set(CMAKE_FIND_ROOT_PATH_MODE_LIBRARY ONLY)' >> '{{tmp_dir|shsqe}}/Toolchain.cmake'
-        echo 'set(CMAKE_FIND_ROOT_PATH_MODE_INCLUDE ONLY)' >> '{{tmp_dir|shsqe}}/Toolchain.cmake'
     ) && \
     {% endif -%}
     {%- if build_dir != "." -%}
@@ -114,7 +139,9 @@
     {% endfor -%}
     '{{cmake_prog|shsqe}}'
     {%- if host -%}
-    {%- if tmp_dir.startswith("/") %} \
+    {%- if toolchain_cache_dir %} \
+        -DCMAKE_TOOLCHAIN_FILE="$espact_toolchain_file"
+    {%- elif tmp_dir.startswith("/") %} \
         -DCMAKE_TOOLCHAIN_FILE='{{tmp_dir|shsqe}}/Toolchain.cmake'
     {%- else %} \
         -DCMAKE_TOOLCHAIN_FILE='../{{tmp_dir|shsqe}}/Toolchain.cmake'
@@ -141,6 +168,10 @@
     {%- if (not host) and cc %} \
         -DCMAKE_C_COMPILER='{{cc|shsqe}}'
     {%- endif -%}
+    {%- if compiler_launcher %} \
+        -DCMAKE_C_COMPILER_LAUNCHER='{{compiler_launcher|shsqe}}' \
+        -DCMAKE_CXX_COMPILER_LAUNCHER='{{compiler_launcher|shsqe}}'
+    {%- endif -%}
     {%- if cflags %} \
         -DCMAKE_C_FLAGS='{{cflags|shsqe}}'
     {%- endif -%}
@@ -22,6 +22,14 @@
 {%- if not make_prog -%}
 {%- set make_prog = "make" -%}
 {%- endif -%}
+{%- if make_prog == "gmake" or (make_prog == "make" and platform.system() not in ["BSD/OS", "FreeBSD", "NetBSD", "OpenBSD", "DragonFly"]) -%}
+{%- set is_gnu_make = True -%}
+{%- else -%}
+{%- set is_gnu_make = False -%}
+{%- endif -%}
+{% if not is_gnu_make -%}
+MAKEFLAGS="${ESPACT_SAVED_MAKEFLAGS-$MAKEFLAGS}" \
+{% endif -%}
 {% for name in env -%}
 {{name}}='{{env[name]|shsqe}}' \
 {% endfor -%}
@@ -0,0 +1,54 @@
+# -*- coding: UTF-8 -*-
+# Copyright (c) 2018 Łukasz Szpakowski
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import fcntl
+import os
+import threading
+import time
+import unittest
+from espact.jobserver import JobServer
+
+class JobServerTest(unittest.TestCase):
+    def setUp(self):
+        self.job_server = JobServer(2)
+        flags = fcntl.fcntl(self.job_server.read_fd, fcntl.F_GETFL)
+        fcntl.fcntl(self.job_server.read_fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+    def tearDown(self):
+        self.job_server.close()
+
+    def test_acquire_takes_token_from_nonblocking_pipe(self):
+        self.assertEqual("+", self.job_server.acquire())
+
+    def test_acquire_waits_for_released_token_on_nonblocking_pipe(self):
+        token = self.job_server.acquire()
+        tokens = []
+        thread = threading.Thread(target = lambda: tokens.append(self.job_server.acquire()))
+        thread.start()
+        time.sleep(0.1)
+        self.assertEqual([], tokens)
+        self.job_server.release(token)
+        thread.join(5)
+        self.assertEqual(["+"], tokens)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+# -*- coding: UTF-8 -*-
+# Copyright (c) 2018 Łukasz Szpakowski
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+from os import makedirs
+from os.path import join
+import shutil
+import tempfile
+import unittest
+from espact.package import PackageCollection
+
+class PackageCollectionTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        makedirs(join(self.dir, "packages"))
+        makedirs(join(self.dir, "templates"))
+        self._write_file(join("packages", "p.info.yml"), "name: p\n")
+        self._write_file(join("templates", "default.rules.yml"), "build:\n  cmd: echo {{name}}\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write_file(self, file, string):
+        stream = open(join(self.dir, file), "w")
+        try:
+            stream.write(string)
+        finally:
+            stream.close()
+
+    def _package_collection(self):
+        return PackageCollection(dir = self.dir, work_dir = join(self.dir, "work"))
+
+    def test_packages_loaded_in_pool_have_template_fingerprints(self):
+        package_collection = self._package_collection()
+        fingerprint = package_collection.compute_package_template_fingerprint("p")
+        self.assertNotEqual(None, fingerprint)
+        package_collection = self._package_collection()
+        self.assertEqual(["p"], list(package_collection.load_packages_in_pool(["p"], 2)))
+        self.assertEqual(fingerprint, package_collection.compute_package_template_fingerprint("p"))
+        self._write_file(join("templates", "default.rules.yml"), "build:\n  cmd: echo {{name}} changed\n")
+        package_collection = self._package_collection()
+        self.assertEqual(["p"], list(package_collection.load_packages_in_pool(["p"], 2)))
+        self.assertNotEqual(fingerprint, package_collection.compute_package_template_fingerprint("p"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+# -*- coding: UTF-8 -*-
+# Copyright (c) 2018 Łukasz Szpakowski
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import datetime
+import fcntl
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from espact.package import make_target
+from espact.store import MadeTargetJournalStore, made_target_time_to_string
+
+class MadeTargetJournalStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.time = datetime.datetime(2020, 1, 1)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_compaction_keeps_lines_which_are_appended_concurrently(self):
+        store = MadeTargetJournalStore(self.work_dir, batch_size = 1)
+        for i in range(5):
+            store.add_made_target(make_target("package1", "build"), self.time)
+        stream = open(os.path.join(self.work_dir, "targets.journal"), "a")
+        fcntl.flock(stream.fileno(), fcntl.LOCK_EX)
+        times = []
+        thread = threading.Thread(target = lambda: times.append(store.load_made_target_times()))
+        thread.start()
+        time.sleep(0.1)
+        stream.write(made_target_time_to_string(self.time) + "\tpackage2\tbuild\n")
+        stream.close()
+        thread.join(5)
+        targets = [make_target("package1", "build"), make_target("package2", "build")]
+        self.assertEqual(targets, sorted(times[0].keys()))
+        self.assertEqual(targets, sorted(MadeTargetJournalStore(self.work_dir).load_made_target_times().keys()))
+
+    def test_add_made_target_flushes_lines_after_interval(self):
+        store = MadeTargetJournalStore(self.work_dir, flush_interval = 0.0)
+        store.add_made_target(make_target("package", "build"), self.time)
+        self.assertEqual([make_target("package", "build")], MadeTargetJournalStore(self.work_dir).load_made_target_times().keys())
+
+if __name__ == "__main__":
+    unittest.main()